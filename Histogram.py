@@ -1,7 +1,15 @@
 from abc import ABC, abstractmethod
-from consoleprint import RichText
+from array import array
+from consoleprint import RichText, decode_texts, display_width, encode_texts
+import collections
 import copy
+import itertools
 import math
+import threading
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # TODO LIST
 # TODO add option for displaying labels beneath bars
@@ -54,7 +62,7 @@ class NiceNumber:
         if value < 1.0e-3 or value >= 1.0e+7:
             return is_negative * '-' + "{:.2e}".format(value)
         elif value < 1:
-            return (is_negative * '-' + "{:.3f}".format(value)).rstrip('0')
+            return (is_negative * '-' + "{:.3f}".format(value)).rstrip('0').rstrip('.')
         elif value < 10:
             return (is_negative * '-' + str(round(value, 2))).rstrip('0').rstrip('.')
         elif value < 100:
@@ -72,6 +80,66 @@ def _getcolor(color, index, y):
         raise Exception('unsupported')
 
 
+def _eighths(ytop, dy, value):
+    """
+    Number of eighths of a cell covered by a positive bar
+    :param ytop: y coordinate of the top of the cell
+    :param dy: height of the cell
+    :param value: bar value
+    :return: integer between 0 (empty cell) and 8 (full cell)
+    """
+    return min(8, max(0, int(round((value - ytop + dy) / dy * 8))))
+
+
+# Lower block characters, from one eighth to seven eighths of a cell
+_eighth_blocks = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587'
+
+
+def _layout_key(obj):
+    """
+    Convert an object into a hashable key for the layout cache, see GenericChart.chromebox()
+    RichText objects are converted into their text and canonical formatting runs, lists into tuples
+    """
+    if isinstance(obj, RichText):
+        return 'RichText', obj.str(), obj.__runs__()
+    if isinstance(obj, (list, tuple)):
+        return tuple(_layout_key(o) for o in obj)
+    return obj
+
+
+# Heatmap color palettes, built on first use, see _heatmap_palette()
+_heatmap_palettes = {}
+
+
+def _heatmap_palette(name):
+    """
+    Return the list of colors of a heatmap palette, from the lowest to the highest values
+    All palettes go from blue to red through cyan, green and yellow
+    :param name: '16' (named colors), '256' (xterm color cube) or 'truecolor' (RGB tuples)
+    :return: list of colors
+    """
+    if name not in _heatmap_palettes:
+        if name == '16':
+            palette = ['blue', 'cyan', 'green', 'yellow', 'red']
+        elif name == '256':
+            # Walk along the edges of the 6 x 6 x 6 color cube
+            path = [(0, g, 5) for g in range(6)] + [(0, 5, b) for b in range(4, -1, -1)] + \
+                   [(r, 5, 0) for r in range(1, 6)] + [(5, g, 0) for g in range(4, -1, -1)]
+            palette = [16 + 36 * r + 6 * g + b for r, g, b in path]
+        elif name == 'truecolor':
+            corners = [(0, 0, 255), (0, 255, 255), (0, 255, 0), (255, 255, 0), (255, 0, 0)]
+            palette = []
+            for i in range(256):
+                pos = i / 255.0 * (len(corners) - 1)
+                k = min(int(pos), len(corners) - 2)
+                t = pos - k
+                palette.append(tuple(int(round(a + (b - a) * t)) for a, b in zip(corners[k], corners[k + 1])))
+        else:
+            raise ValueError('unknown palette \'' + str(name) + '\', should be \'16\', \'256\' or \'truecolor\'')
+        _heatmap_palettes[name] = palette
+    return _heatmap_palettes[name]
+
+
 class ChartBox:
     """
     Implementation of chart box (i.e. a piece of a chart) as a list of strings
@@ -89,8 +157,32 @@ class ChartBox:
     def __setitem__(self, key, value):
         self._strings[key] = value
 
+    def __reduce__(self):
+        """
+        Pickling support, using the compact binary format of to_bytes()
+        """
+        return ChartBox.from_bytes, (self.to_bytes(),)
+
     def __str__(self):
-        return str(RichText('\n').join(self._strings))
+        return ''.join(self.iter_render())
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        Create a chart box from its compact binary representation, see to_bytes()
+        :param data: bytes
+        :return: ChartBox
+        """
+        box = ChartBox()
+        box._strings = decode_texts(data)
+        return box
+
+    def to_bytes(self):
+        """
+        Compact binary representation: all rows share a single table of interned styles
+        :return: bytes
+        """
+        return encode_texts(self._strings)
 
     def laddblank(self, num):
         """
@@ -236,6 +328,48 @@ class ChartBox:
         self._strings = copy.deepcopy(other._strings) + self._strings
         return self
 
+    def iter_render(self, chunk_size=65536, encoding=None):
+        """
+        Generate the formatted chart box row by row, rows being separated by newline characters
+        Small rows are grouped in chunks, large rows are split in chunks, so that memory usage stays bounded
+        :param chunk_size: approximate number of characters per chunk
+        :param encoding: optional encoding, chunks are yielded as bytes if set and as strings otherwise
+        :return: generator of strings or bytes
+        """
+        pieces = []
+        size = 0
+        for i in range(len(self._strings)):
+            row = self._strings[i]
+            if i > 0:
+                pieces.append('\n')
+                size += 1
+            if isinstance(row, RichText):
+                row_pieces = row.iter_render(chunk_size)
+            else:
+                row_pieces = [row[k:k+chunk_size] for k in range(0, len(row), chunk_size)]
+            for piece in row_pieces:
+                pieces.append(piece)
+                size += len(piece)
+                if size >= chunk_size:
+                    chunk = ''.join(pieces)
+                    yield chunk if encoding is None else chunk.encode(encoding)
+                    pieces = []
+                    size = 0
+        if len(pieces) > 0:
+            chunk = ''.join(pieces)
+            yield chunk if encoding is None else chunk.encode(encoding)
+
+    def write_to(self, fileobj, chunk_size=65536, encoding=None):
+        """
+        Write the formatted chart box to a file object chunk by chunk, see iter_render()
+        :param fileobj: file object, opened in binary mode if an encoding is set
+        :param chunk_size: approximate number of characters per chunk
+        :param encoding: optional encoding
+        :return: self
+        """
+        fileobj.writelines(self.iter_render(chunk_size, encoding))
+        return self
+
     def isempty(self):
         """
         Return True if the chart box is empty
@@ -256,10 +390,103 @@ class ChartBox:
 
     def width(self):
         """
-        Compute the width of the chart box (max number of characters in the underlying strings)
+        Compute the width of the chart box (max display width of the underlying strings)
+        :return: integer
+        """
+        return 0 if len(self) == 0 else max(display_width(s) for s in self._strings)
+
+
+class CellGrid:
+    """
+    Frame buffer of character cells, used for drawing figures with direct cell writes
+    Each cell holds a character and a style id, styles being interned in a table of style dictionaries
+    Cells are converted to RichText objects (run-length encoded styles) only when the grid is output
+    Rows are indexed from the bottom (row 0) to the top, as in chart boxes before they are reversed
+    """
+
+    def __init__(self, width, height, char=' '):
+        self._width = width
+        self._height = height
+        self._styles = [{'fg': None, 'bg': None, 'style': None}]  # style id 0 is the plain style
+        self._style_ids = {(None, None, None): 0}
+        self._chars = [[char] * width for _ in range(height)]
+        self._cells = [array('I', [0]) * width for _ in range(height)]
+
+    def __len__(self):
+        return self._height
+
+    def styleid(self, fg=None, bg=None, style=None):
+        """
+        Return the id of a style, adding it to the style table if needed
+        :param fg: foreground color
+        :param bg: background color
+        :param style: font style
         :return: integer
         """
-        return 0 if len(self) == 0 else max(len(s) for s in self._strings)
+        key = (fg, bg, style)
+        sid = self._style_ids.get(key)
+        if sid is None:
+            sid = len(self._styles)
+            self._styles.append({'fg': fg, 'bg': bg, 'style': style})
+            self._style_ids[key] = sid
+        return sid
+
+    def fill(self, x, y, length, char, sid):
+        """
+        Write the same character and style in consecutive cells of a row, cells outside the grid are ignored
+        :param x: index of the first cell in the row
+        :param y: row index
+        :param length: number of cells
+        :param char: character
+        :param sid: style id, see styleid()
+        :return: self
+        """
+        start = max(0, x)
+        stop = min(self._width, x + length)
+        if stop > start:
+            self._chars[y][start:stop] = [char] * (stop - start)
+            self._cells[y][start:stop] = array('I', [sid]) * (stop - start)
+        return self
+
+    def write(self, x, y, text, sid):
+        """
+        Write a string in a row, one character per cell, characters outside the grid are ignored
+        :param x: index of the first cell in the row
+        :param y: row index
+        :param text: string
+        :param sid: style id, see styleid()
+        :return: self
+        """
+        start = max(0, x)
+        stop = min(self._width, x + len(text))
+        if stop > start:
+            self._chars[y][start:stop] = text[start - x:stop - x]
+            self._cells[y][start:stop] = array('I', [sid]) * (stop - start)
+        return self
+
+    def row(self, y):
+        """
+        Convert a row into a RichText object, consecutive cells sharing the same style being grouped
+        :param y: row index
+        :return: RichText object
+        """
+        chars = self._chars[y]
+        runs = []
+        start = 0
+        for sid, group in itertools.groupby(self._cells[y]):
+            stop = start + sum(1 for _ in group)
+            runs.append((''.join(chars[start:stop]), self._styles[sid]))
+            start = stop
+        return RichText.__from_runs__(runs)
+
+    def chartbox(self):
+        """
+        Convert the grid into a chart box, rows being ordered from the bottom to the top
+        :return: ChartBox
+        """
+        box = ChartBox()
+        box.append([self.row(y) for y in range(self._height)])
+        return box
 
 
 class GenericChart(ABC):
@@ -267,11 +494,118 @@ class GenericChart(ABC):
     This is the broadest and most generic implementation of a chart
     It only implements standard methods
     """
+    # Lock guarding layout caches, which are the only state written to while plotting
+    _layout_lock = threading.Lock()
+
     def __init__(self, height=20):
         if not isinstance(height, int) or height < 5:
             raise ValueError('height should be an integer value and should be greater than 5')
         self._height = height
         self.left_margin_size = 5
+        # Cache of the chart chrome (footer, legend and title boxes), shared with render contexts, see chromebox()
+        self._layout_cache = {}
+        self._layout_cache_size = 32
+
+    def chromebox(self, kind, key, build):
+        """
+        Return a box of the chart chrome (footer, legend or title) from the layout cache, building it if needed
+        Boxes are copied when retrieved from the cache since they are modified when assembling the chart
+        The cache is the only state of the chart written to while plotting: it never changes the output,
+        and it is guarded by a lock so that charts can still be shared between threads
+        :param kind: kind of box, e.g. 'footer'
+        :param key: everything the box depends on (labels, legend position, geometry...), None to disable caching
+        :param build: function building the box
+        :return: ChartBox
+        """
+        if key is None:
+            return build()
+        key = (kind, _layout_key(key))
+        with self._layout_lock:
+            box = self._layout_cache.get(key)
+        if box is None:
+            # Build outside of the lock, concurrent renderings would at worst build the same box twice
+            box = build()
+            with self._layout_lock:
+                if key not in self._layout_cache and len(self._layout_cache) >= self._layout_cache_size:
+                    # Evict the oldest entry
+                    self._layout_cache.pop(next(iter(self._layout_cache)), None)
+                self._layout_cache[key] = box
+        return copy.deepcopy(box)
+
+    def geometry(self, data):
+        """
+        Return a hashable description of everything the figure footer depends on besides labels
+        Charts which do not implement it don't cache their footer
+        :param data: data to plot
+        :return: hashable object, or None
+        """
+        return None
+
+    def context(self, **state):
+        """
+        Create a render context, i.e. a shallow copy of the chart holding the state of a single rendering
+        Charts are never modified while plotting, so that they can be reused or shared between threads,
+        the only exception being the layout cache which is shared with render contexts, see chromebox()
+        :param state: attributes to set in the render context
+        :return: render context, to be used in place of the chart
+        """
+        context = copy.copy(self)
+        for name, value in state.items():
+            setattr(context, name, value)
+        return context
+
+    def colorlegendbox(self, labels, legendpos, palette):
+        """
+        Generate a legend box with a small color patch on the left of each label, colors cycling through the palette
+        :param labels: legend labels, None for no legend
+        :param legendpos: legend position, should be 'top', 'bottom' or 'right'
+        :param palette: list of colors
+        :return: ChartBox
+        """
+        legend = ChartBox()
+        if labels is None:
+            return legend
+        for i in range(len(labels)):
+            legend.append(RichText(' ' * 3, bg=palette[i % len(palette)]) + ' ' + labels[i])
+        if legendpos == 'right':
+            legend.reverse()
+        return legend
+
+    def axisbox(self, coords, ticks, numticks, formatter=lambda y: str(NiceNumber(y)), size=None, nomarker=()):
+        """
+        Generate a y axis box: tick labels right-aligned on the left of the axis markers
+        :param coords: y coordinates of the rows in ascending order
+        :param ticks: y axis ticks settings, see get_tick_indices(), None for no tick
+        :param numticks: minimum number of ticks to display, only applies when ticks is 'auto'
+        :param formatter: function formatting a coordinate as a tick label
+        :param size: number of rows, defaults to the number of coordinates
+        :param nomarker: indices of the rows without axis marker
+        :return: ChartBox representing the y axis, ordered from the bottom to the top
+        """
+        if ticks is not None:
+            tick_indices, numchar = get_tick_indices(ticks, numticks, coords)
+        else:
+            tick_indices = []
+            numchar = 0
+        yaxis = ChartBox()
+        for j in range(len(coords) if size is None else size):
+            # Rows without tick get extra spaces to keep alignment
+            s = formatter(coords[j]).rjust(numchar) if j in tick_indices else numchar * ' '
+            yaxis.append(RichText(s + (' ' if j in nomarker else '|'), style='bold'))
+        return yaxis
+
+    def boundsfooterbox(self, left, right, width):
+        """
+        Generate a figure footer with the bounds of the x axis at both ends of the figure
+        :param left: label of the lower bound
+        :param right: label of the upper bound
+        :param width: figure width
+        :return: ChartBox
+        """
+        footer = ChartBox()
+        footer.append(RichText(left, style='bold') + ' ' * max(1, width - len(left) - len(right)) +
+                      RichText(right, style='bold'))
+        return footer
 
     @abstractmethod
     def figurebox(self, data):
@@ -302,8 +636,10 @@ class GenericChart(ABC):
         # Generate chart boxes
         yaxis = self.yaxis(data, ticks, numticks)
         figurebox = self.figurebox(data)
-        legendbox = self.legendbox(legend, legendpos)
-        figurefooterbox = self.figurefooterbox(data, labels)
+        legendbox = self.chromebox('legend', (legend, legendpos), lambda: self.legendbox(legend, legendpos))
+        geometry = self.geometry(data)
+        figurefooterbox = self.chromebox('footer', None if geometry is None else (labels, geometry),
+                                         lambda: self.figurefooterbox(data, labels))
         # Concatenate the figure footer inside the figure box,
         # then add the missing extra blank rows to the y axis
         hasfooter = not figurefooterbox.isempty()
@@ -336,8 +672,8 @@ class GenericChart(ABC):
         # Create the title box
         hastitle = title is not None and len(title) > 0
         if hastitle:
-            titlebox = ChartBox()
-            titlebox.append(title if isinstance(title, RichText) else RichText(title, style='bold'))
+            titlebox = self.chromebox('title', title, lambda: ChartBox().append(
+                title if isinstance(title, RichText) else RichText(title, style='bold')))
             titlebox, figurebox = titlebox.hcenter(figurebox)
             figurebox.tconcat(titlebox.baddblank(2))
 
@@ -354,13 +690,17 @@ class Bars(GenericChart):
     Standard bar chart
     """
 
-    def __init__(self, color='blue', height=20, showvalues=False, spacing=2, thickness=5, ymax=None):
+    def __init__(self, color='blue', height=20, showvalues=False, spacing=2, thickness=5, ymax=None, subcells=False):
+        """
+        :param subcells: if True, the tops of positive bars are drawn with eighth blocks (sub-cell resolution)
+        """
         super(Bars, self).__init__(height)
         self._color = color
         self._showvalues = showvalues
         self._spacing = spacing
         self._thickness = thickness
         self._ymax = ymax
+        self._subcells = subcells
 
     def figurebox(self, data):
         """
@@ -371,49 +711,58 @@ class Bars(GenericChart):
         ycoords, dy = self.ycoordinates(data)
         # Determine the figure's width
         width = num_bars * self._thickness + (num_bars + 1) * self._spacing
-        # Build the figure box and initialize it with the x axis
-        figure_box = ChartBox()
+        # Compute the start index of each bar along the x axis
+        bar_start = [self._spacing + i * (self._thickness + self._spacing) for i in range(num_bars)]
+        # Build the figure in a frame buffer, with an extra row on top for bar values
+        grid = CellGrid(width, len(ycoords) + int(bool(self._showvalues)))
         # Draw the figure
         for j in range(len(ycoords)):
             if ycoords[j] == 0:
-                figure_box.append([RichText('-' * width, style='bold')])
+                grid.fill(0, j, width, '-', grid.styleid(style='bold'))
             else:
                 ysign = 1 if ycoords[j] >= 0 else -1
                 # For coloring, we take the middle of the cell into account
                 # --> subtract 0.5 * dy for positive y and add 0.5 * dy for negative y
                 y = ycoords[j] - 0.5 * ysign * dy
-                s = RichText(' ' * self._spacing)  # add the first spacing
                 for i in range(num_bars):
                     color = _getcolor(self._color, i, y)
-                    if 0 <= y <= data[i] or 0 >= y >= data[i]:
-                        s += RichText(' ' * self._thickness, bg=color)
+                    if self._subcells and ycoords[j] > 0 and data[i] >= 0:
+                        # Sub-cell resolution: the top cell of the bar is partially filled with an eighth block
+                        eighths = _eighths(ycoords[j], dy, data[i])
+                        if eighths == 8:
+                            grid.fill(bar_start[i], j, self._thickness, ' ', grid.styleid(bg=color))
+                        elif eighths > 0:
+                            # The middle of a partially filled cell may be above the bar value, color at the value
+                            grid.fill(bar_start[i], j, self._thickness, _eighth_blocks[eighths - 1],
+                                      grid.styleid(fg=_getcolor(self._color, i, min(y, data[i]))))
+                        elif ycoords[j] == dy:
+                            grid.fill(bar_start[i], j, self._thickness, ' ', grid.styleid(fg=color, style='underline'))
+                    elif 0 <= y <= data[i] or 0 >= y >= data[i]:
+                        grid.fill(bar_start[i], j, self._thickness, ' ', grid.styleid(bg=color))
                     elif ycoords[j] == dy and 0 <= data[i] <= y:
                         # On the first row, add underlining to materialize the bar
-                        s += RichText(' ' * self._thickness, fg=color, style='underline')
-                    else:
-                        s += ' ' * self._thickness
-                    s += ' ' * self._spacing
-                figure_box.append(s.__clean_style_boxes__())
+                        grid.fill(bar_start[i], j, self._thickness, ' ', grid.styleid(fg=color, style='underline'))
         # Add bar values
         if self._showvalues:
-            # Add an extra line to the figure box
-            figure_box.append(RichText(' ' * width))
-            # Compute the start and stop indices of each bar along the x axis
-            bar_start = [self._spacing + i * (self._thickness + self._spacing) for i in range(num_bars)]
-            bar_stop = [i + self._thickness for i in bar_start]
             # Put values above bars
             for i in range(num_bars):
-                # Get the height index of the string where the label should be put
-                j = ([y - 0.5 * dy > data[i] for y in ycoords] + [True]).index(True)
+                # Get the height index of the row where the label should be put
+                if self._subcells and data[i] >= 0:
+                    j = ([y > 0 and _eighths(y, dy, data[i]) == 0 for y in ycoords] + [True]).index(True)
+                else:
+                    j = ([y - 0.5 * dy > data[i] for y in ycoords] + [True]).index(True)
                 # Center the value string in the middle of the bar
-                valuestr = RichText(str(NiceNumber(data[i]))).center(bar_stop[i] - bar_start[i], pushleft=True)
+                valuestr = RichText(str(NiceNumber(data[i]))).center(self._thickness, pushleft=True).str()
                 color = _getcolor(self._color, i, ycoords[max(j-1, 0)] - 0.5 * dy)
-                if j == 1:
-                    valuestr = RichText(valuestr, fg=color, style='bold+underline')
-                else:
-                    valuestr = RichText(valuestr, fg=color, style='bold')
-                figure_box[j] = figure_box[j][0:bar_start[i]] + valuestr + figure_box[j][bar_stop[i]:]
-        return figure_box
+                style = 'bold+underline' if j == 1 else 'bold'
+                grid.write(bar_start[i], j, valuestr, grid.styleid(fg=color, style=style))
+        return grid.chartbox()
+
+    def geometry(self, data):
+        """
+        The figure footer only depends on the number of bars and on their layout
+        """
+        return len(data), self._spacing, self._thickness
 
     def figurefooterbox(self, data, labels):
         """
@@ -433,21 +782,12 @@ class Bars(GenericChart):
             # Start and stop indices of the current bar
             start = self._spacing + i * (self._thickness + self._spacing)
             stop = start + self._thickness
-            if len(current_label) > stop - start:
-                # If the label is too long, try splitting it first
-                current_label = current_label.split(' ')
-                # If it is still to long, skip this label
-                if max(len(s) for s in current_label) > stop - start:
+            if display_width(current_label) > stop - start:
+                # If the label is too long and one of its words is too long too, skip this label
+                if max(display_width(s) for s in current_label.split(' ')) > stop - start:
                     continue
-                # Try to bring some pieces together
-                idx = 0
-                while idx < len(current_label) - 1:
-                    merged_labels = ' '.join(current_label[idx:idx+2])
-                    if len(merged_labels) <= stop - start:
-                        current_label[idx] = merged_labels
-                        del current_label[idx+1]
-                    else:
-                        idx += 1
+                # Otherwise wrap it on several lines
+                current_label = RichText(current_label).wrap(stop - start)
             else:
                 # Otherwise put the label in a list with a single element
                 # This is just to have the same data structure as when the label does not fit
@@ -484,31 +824,16 @@ class Bars(GenericChart):
         ycoords, _ = self.ycoordinates(data)
         has_pos_coords = sum(1 for y in ycoords if y > 0) > 0
         has_neg_coords = sum(1 for y in ycoords if y < 0) > 0
-        # Compute ticks
-        if ticks is not None:
-            tick_indices, numchar = get_tick_indices(ticks, numticks, ycoords)
-        else:
-            tick_indices = []
-            numchar = 0
-        # Create the y axis
-        yaxis = ChartBox()
         # TODO add comment to explain why we use height + showvalues below
         num_extra_rows = int(self._showvalues) * (int(has_pos_coords) + int(has_neg_coords))
         axis_size = len(ycoords) + num_extra_rows
-        for j in range(axis_size):
-            s = ''
-            if ticks is not None:
-                if j in tick_indices:
-                    # Put a tick on the current line
-                    s += str(NiceNumber(ycoords[j])).rjust(numchar)
-                else:
-                    # No tick on current line --> add extra spaces to keep alignment
-                    s += numchar * ' '
-            # Add the y axis marker
-            no_axis_marker = self._showvalues and ((j == 0 and has_neg_coords) or (j == axis_size - 1 and has_pos_coords))
-            s += '|' if not no_axis_marker else ' '
-            yaxis.append(RichText(s, style='bold'))
-        return yaxis
+        # Rows holding bar values have no axis marker
+        nomarker = []
+        if self._showvalues and has_neg_coords:
+            nomarker.append(0)
+        if self._showvalues and has_pos_coords:
+            nomarker.append(axis_size - 1)
+        return self.axisbox(ycoords, ticks, numticks, size=axis_size, nomarker=nomarker)
 
     def ycoordinates(self, data):
         """
@@ -532,8 +857,8 @@ class Bars(GenericChart):
 
 class StackedBars(Bars):
 
-    def __init__(self, height=20, spacing=2, thickness=5):
-        super(StackedBars, self).__init__(height=height, spacing=spacing, thickness=thickness)
+    def __init__(self, height=20, spacing=2, thickness=5, subcells=False):
+        super(StackedBars, self).__init__(height=height, spacing=spacing, thickness=thickness, subcells=subcells)
 
     def colorpalette(self):
         """
@@ -542,6 +867,14 @@ class StackedBars(Bars):
         """
         return ['red', 'green', 'blue', 'yellow', 'magenta', 'cyan']
 
+    def categories(self, data):
+        """
+        Form categories by retrieving all keys from all input data, without any duplicate
+        :param data: list of dictionaries
+        :return: sorted list of categories
+        """
+        return sorted(set(k for d in data for k in d))
+
     def coloring(self, y, dictionary, categories):
         """
         This is the bar coloring function
@@ -570,14 +903,7 @@ class StackedBars(Bars):
         :param legendpos: legend position, should be 'top', 'bottom' or 'right'
         :return: list of strings to be placed in the figure's legend box
         """
-        legend = ChartBox()
-        for i in range(len(labels)):
-            color = self.colorpalette()[i % len(self.colorpalette())]
-            # Create a small color patch and put the label on its right
-            legend.append(RichText(' ' * 3, bg=color) + ' ' + labels[i])
-        if legendpos == 'right':
-            legend.reverse()
-        return legend
+        return self.colorlegendbox(labels, legendpos, self.colorpalette())
 
     def plot(self, data, legendpos='right', numticks=5, ticks='auto', title=None):
         """
@@ -586,17 +912,10 @@ class StackedBars(Bars):
         :param ticks: y axis ticks
         :return:
         """
-        # Form categories by retrieving all keys from all input data
-        # We do not want any duplicate here
-        categories = []
-        for d in data:
-            for k in d.keys():
-                if k not in categories:
-                    categories.append(k)
-        categories = sorted(categories)
-        # Create the plot
-        self._color = lambda idx, y: self.coloring(y, data[idx], categories)
-        super(StackedBars, self).plot(
+        categories = self.categories(data)
+        # Create the plot, bar colors depending on the input data
+        context = self.context(_color=lambda idx, y: self.coloring(y, data[idx], categories))
+        super(StackedBars, context).plot(
             [sum(d.values()) for d in data],
             legend=categories, legendpos=legendpos, numticks=numticks, ticks=ticks, title=title)
 
@@ -615,22 +934,11 @@ class PercentageStackedBars(StackedBars):
         :param ticks: y axis ticks, should be 'all' (default), 'auto' or a list of numeric values
         :param title: string, figure title
         """
-        # Form categories by retrieving all keys from all input data
-        # We do not want any duplicates here
-        categories = []
-        for d in data:
-            for k in d.keys():
-                if k not in categories:
-                    categories.append(k)
-        categories = sorted(categories)
-        # Convert values to percentages
-        for current_dict in data:
-            sum_values = sum(current_dict.values())
-            for k in current_dict.keys():
-                current_dict[k] = current_dict[k] / sum_values * 100.0
-        # Set the coloring function
-        self._color = lambda idx, y: self.coloring(y, data[idx], categories)
-        super(StackedBars, self).plot(
+        categories = self.categories(data)
+        # Scale the plotted percentage back to the bar's raw values instead of normalizing every dictionary
+        sums = [sum(d.values()) for d in data]
+        context = self.context(_color=lambda idx, y: self.coloring(y * sums[idx] / 100.0, data[idx], categories))
+        super(StackedBars, context).plot(
             [100] * len(data),  # with stacked bars, we only plot bars of size 100
             legend=categories, legendpos=legendpos, numticks=numticks, ticks=ticks, title=title)
 
@@ -638,9 +946,10 @@ class PercentageStackedBars(StackedBars):
 class PositiveNegativeBars(Bars):
 
     def __init__(self, color=lambda index, y: 'red' if y < 0 else 'green', height=20, showvalues=False, spacing=2,
-                 thickness=5, ymax=None, ymin=None):
+                 thickness=5, ymax=None, ymin=None, subcells=False):
         super(PositiveNegativeBars, self).__init__(
-            height=height, color=color, showvalues=showvalues, spacing=spacing, thickness=thickness, ymax=ymax)
+            height=height, color=color, showvalues=showvalues, spacing=spacing, thickness=thickness, ymax=ymax,
+            subcells=subcells)
         self._ymin = ymin
 
 
@@ -676,8 +985,6 @@ class PositiveNegativeBars(Bars):
             pnumcells, mnumcells = mnumcells, pnumcells
         # Compute y coordinates
         ycoords = [-i * dy for i in range(mnumcells, 0, -1)] + [i * dy for i in range(1, pnumcells + 1)]
-        # Adjust height
-        self._height = len(ycoords)
         # Compute the y coordinates
         # Enforce the min and max values as last element to prevent round off errors
         if maxbound == abs(ymin):
@@ -685,3 +992,553 @@ class PositiveNegativeBars(Bars):
         if maxbound == ymax:
             ycoords[-1] = ymax
         return ycoords, dy
+
+
+class ScrollingBars(Bars):
+    """
+    Scrolling bar chart for streams of non-negative values, e.g. for monitoring
+    The last values are kept in a ring buffer along with their drawn columns: pushing a value only draws
+    its own column, all columns being redrawn only when the scale of the y axis changes
+    """
+
+    def __init__(self, capacity=40, color='blue', height=20, spacing=1, thickness=1, ymax=None):
+        """
+        :param capacity: number of bars displayed, older values are dropped
+        :param color: bar color, or function of (index, y) where index is the number of values pushed before
+        :param height: height of the figure, in characters
+        :param spacing: number of characters between bars
+        :param thickness: width of the bars, in characters
+        :param ymax: optional minimum upper bound of the y axis
+        """
+        super(ScrollingBars, self).__init__(color=color, height=height, spacing=spacing, thickness=thickness,
+                                            ymax=ymax)
+        self._values = collections.deque(maxlen=capacity)
+        self._columns = collections.deque(maxlen=capacity)  # style keys of the cells of each bar, from the bottom
+        self._count = 0  # number of values pushed so far
+        self._scale = None  # upper bound of the y axis the columns were drawn with
+
+    def __len__(self):
+        return len(self._values)
+
+    def column(self, index, value, ycoords, dy):
+        """
+        Draw a single bar
+        :param index: number of values pushed before this one
+        :param value: bar value
+        :param ycoords: y coordinates, see ycoordinates()
+        :param dy: spacing along the y axis
+        :return: list of (fg, bg, style) keys, one per row above the x axis
+        """
+        cells = []
+        for j in range(1, len(ycoords)):
+            if ycoords[j] == 0:
+                # Degenerate range (all values are zero): the row is drawn as an axis, see figurebox()
+                cells.append((None, None, None))
+                continue
+            # For coloring, we take the middle of the cell into account
+            y = ycoords[j] - 0.5 * dy
+            color = _getcolor(self._color, index, y)
+            if 0 <= y <= value:
+                cells.append((None, color, None))
+            elif ycoords[j] == dy and 0 <= value <= y:
+                # On the first row, add underlining to materialize the bar
+                cells.append((color, None, 'underline'))
+            else:
+                cells.append((None, None, None))
+        return cells
+
+    def push(self, value):
+        """
+        Add a value on the right of the chart, dropping the oldest one if the chart is full
+        Only the column of the new bar is drawn, unless the scale of the y axis changes
+        :param value: non-negative number
+        :return: self
+        """
+        if value < 0:
+            raise ValueError('scrolling bar charts only support non-negative values')
+        dropped = self._values[0] if len(self._values) == self._values.maxlen else None
+        self._values.append(value)
+        self._count += 1
+        # The scale changes if the new value is above it, or if the value defining it scrolled out
+        if self._scale is None or value > self._scale or (dropped is not None and dropped >= self._scale):
+            scale = max(self._values) if self._ymax is None else max(max(self._values), self._ymax)
+            if scale != self._scale:
+                self._scale = scale
+                self.redraw()
+                return self
+        ycoords, dy = self.ycoordinates([self._scale])
+        self._columns.append(self.column(self._count - 1, value, ycoords, dy))
+        return self
+
+    def extend(self, values):
+        """
+        Push several values, see push()
+        :param values: iterable of non-negative numbers
+        :return: self
+        """
+        for value in values:
+            self.push(value)
+        return self
+
+    def redraw(self):
+        """
+        Draw all the columns again, e.g. after a change of scale
+        :return: self
+        """
+        ycoords, dy = self.ycoordinates([self._scale])
+        first = self._count - len(self._values)
+        self._columns.clear()
+        for i, value in enumerate(self._values):
+            self._columns.append(self.column(first + i, value, ycoords, dy))
+        return self
+
+    def figurebox(self, data):
+        """
+        Assemble the figure from the drawn columns
+        :param data: values of the ring buffer
+        :return: ChartBox
+        """
+        ycoords, _ = self.ycoordinates([self._scale])
+        width = len(self._columns) * self._thickness + (len(self._columns) + 1) * self._spacing
+        grid = CellGrid(width, len(ycoords))
+        # Draw the x axis, on every row like regular bar charts when the y range is degenerate
+        for j in range(len(ycoords)):
+            if ycoords[j] == 0:
+                grid.fill(0, j, width, '-', grid.styleid(style='bold'))
+        for i, cells in enumerate(self._columns):
+            start = self._spacing + i * (self._thickness + self._spacing)
+            for j in range(len(cells)):
+                if cells[j] != (None, None, None):
+                    grid.fill(start, j + 1, self._thickness, ' ', grid.styleid(*cells[j]))
+        return grid.chartbox()
+
+    def plot(self, numticks=5, ticks='auto', title=None):
+        """
+        Print the chart with the values currently in the ring buffer
+        :param numticks: minimum number of ticks to display
+        :param ticks: y axis ticks, should be 'auto' (default), 'all' or None
+        :param title: string, figure title
+        """
+        if len(self._values) == 0:
+            raise ValueError('no value to plot, use push() first')
+        super(ScrollingBars, self).plot(list(self._values), numticks=numticks, ticks=ticks, title=title)
+
+
+class Scatter(GenericChart):
+    """
+    Scatter plot drawn with braille characters, each character cell holding 2 x 4 dots
+    Rasterization is vectorized with NumPy, so that plotting millions of points stays fast
+    """
+
+    # Braille dot bits, indexed by [dot row from the bottom of the cell][dot column]
+    _dot_bits = [[0x40, 0x80], [0x04, 0x20], [0x02, 0x10], [0x01, 0x08]]
+
+    def __init__(self, width=60, height=20, color=None, xmin=None, xmax=None, ymin=None, ymax=None):
+        """
+        :param width: width of the figure, in characters
+        :param height: height of the figure, in characters
+        :param color: single color, or list of colors through which series cycle (color palette by default)
+        :param xmin: optional lower bound of the x axis, points beyond the bounds are not drawn
+        :param xmax: optional upper bound of the x axis
+        :param ymin: optional lower bound of the y axis
+        :param ymax: optional upper bound of the y axis
+        """
+        if np is None:
+            raise ImportError('numpy is required for braille charts')
+        super(Scatter, self).__init__(height)
+        self._width = width
+        self._color = color
+        self._xmin = xmin
+        self._xmax = xmax
+        self._ymin = ymin
+        self._ymax = ymax
+
+    def colorpalette(self):
+        """
+        Return the list of all colors through which series cycle
+        :return: list of colors
+        """
+        if self._color is None:
+            return ['blue', 'red', 'green', 'yellow', 'magenta', 'cyan']
+        return [self._color] if isinstance(self._color, str) else list(self._color)
+
+    def series(self, data, x=None):
+        """
+        Convert input data into a list of (x, y) series of float arrays
+        :param data: 1-D sequence of y values, 2-D array or list of 1-D sequences (one per series)
+        :param x: optional x values, either shared by all series or one sequence per series (indices by default)
+        :return: list of (x, y) tuples
+        """
+        if isinstance(data, np.ndarray) and data.ndim == 2:
+            ys = list(data)
+        elif len(data) > 0 and np.ndim(data[0]) > 0:
+            ys = list(data)
+        else:
+            ys = [data]
+        ys = [np.asarray(y, dtype=float).ravel() for y in ys]
+        if x is None:
+            xs = [np.arange(len(y), dtype=float) for y in ys]
+        elif len(x) > 0 and np.ndim(x[0]) > 0:
+            xs = [np.asarray(v, dtype=float).ravel() for v in x]
+        else:
+            xs = [np.asarray(x, dtype=float).ravel()] * len(ys)
+        if len(xs) != len(ys) or any(len(xs[i]) != len(ys[i]) for i in range(len(ys))):
+            raise ValueError('x and y values should have the same lengths')
+        return list(zip(xs, ys))
+
+    def bounds(self, data, axis):
+        """
+        Compute the bounds of an axis, ignoring non-finite values
+        :param data: list of (x, y) series
+        :param axis: 0 for the x axis, 1 for the y axis
+        :return: (min, max) tuple
+        """
+        lower = self._xmin if axis == 0 else self._ymin
+        upper = self._xmax if axis == 0 else self._ymax
+        values = [v[np.isfinite(v)] for v in (s[axis] for s in data)]
+        values = [v for v in values if len(v) > 0]
+        if lower is None:
+            lower = min(float(v.min()) for v in values) if len(values) > 0 else 0.0
+        if upper is None:
+            upper = max(float(v.max()) for v in values) if len(values) > 0 else 1.0
+        if upper <= lower:
+            lower, upper = lower - 0.5, lower + 0.5
+        return lower, upper
+
+    def ycoordinates(self, data):
+        """
+        Compute y coordinates, the first one being the y axis origin and the others the tops of character rows
+        :param data: list of (x, y) series
+        :return ycoords: list of y coordinates in ascending order
+        :return dy: height of a character row along the y axis
+        """
+        ymin, ymax = self.bounds(data, 1)
+        dy = (ymax - ymin) / (self._height * 1.0)
+        # Snap coordinates which only differ from zero because of round off errors
+        ycoords = [ymin + i * dy if abs(ymin + i * dy) > 1.0e-9 * dy else 0.0 for i in range(self._height + 1)]
+        # Enforce the max value as last element to prevent round off errors
+        ycoords[-1] = ymax
+        return ycoords, dy
+
+    def project(self, x, y, xbounds, ybounds):
+        """
+        Project points on the dot grid
+        :param x: array of x values
+        :param y: array of y values
+        :param xbounds: (min, max) bounds of the x axis
+        :param ybounds: (min, max) bounds of the y axis
+        :return: dot column indices, dot row indices (from the bottom) and mask of the points inside the bounds
+        """
+        num_cols = 2 * self._width
+        num_rows = 4 * self._height
+        with np.errstate(invalid='ignore'):
+            inside = (x >= xbounds[0]) & (x <= xbounds[1]) & (y >= ybounds[0]) & (y <= ybounds[1])
+        px = np.zeros(len(x), dtype=np.int64)
+        py = np.zeros(len(y), dtype=np.int64)
+        px[inside] = np.minimum((x[inside] - xbounds[0]) / (xbounds[1] - xbounds[0]) * num_cols, num_cols - 1)
+        py[inside] = np.minimum((y[inside] - ybounds[0]) / (ybounds[1] - ybounds[0]) * num_rows, num_rows - 1)
+        return px, py, inside
+
+    def dots(self, x, y, xbounds, ybounds):
+        """
+        Rasterize a series on the dot grid
+        :param x: array of x values
+        :param y: array of y values
+        :param xbounds: (min, max) bounds of the x axis
+        :param ybounds: (min, max) bounds of the y axis
+        :return: 2-D boolean array of dots, rows being ordered from the bottom to the top
+        """
+        px, py, inside = self.project(x, y, xbounds, ybounds)
+        bitmap = np.zeros((4 * self._height, 2 * self._width), dtype=bool)
+        bitmap[py[inside], px[inside]] = True
+        return bitmap
+
+    def figurebox(self, data):
+        """
+        :param data: list of (x, y) series
+        :return: ChartBox
+        """
+        xbounds = self.bounds(data, 0)
+        ybounds = self.bounds(data, 1)
+        weights = np.array(self._dot_bits, dtype=np.int64)
+        chars = [' '] + [chr(0x2800 + i) for i in range(1, 256)]
+        palette = self.colorpalette()
+        # Pack the dots of each series into braille cells, the last series drawn on a cell gives its color
+        cells = np.zeros((self._height, self._width), dtype=np.int64)
+        owner = np.zeros((self._height, self._width), dtype=np.int64)
+        for i in range(len(data)):
+            bitmap = self.dots(data[i][0], data[i][1], xbounds, ybounds)
+            bits = (bitmap.reshape(self._height, 4, self._width, 2) * weights[None, :, None, :]).sum(axis=(1, 3))
+            cells |= bits
+            owner[bits > 0] = i
+        # Write the cells in a frame buffer, on top of the x axis
+        grid = CellGrid(self._width, self._height + 1)
+        grid.fill(0, 0, self._width, '-', grid.styleid(style='bold'))
+        sids = [grid.styleid(fg=palette[i % len(palette)]) for i in range(len(data))]
+        for j in range(self._height):
+            for i in np.flatnonzero(cells[j]):
+                grid.write(int(i), j + 1, chars[cells[j, i]], sids[owner[j, i]])
+        return grid.chartbox()
+
+    def geometry(self, data):
+        """
+        The figure footer only depends on the bounds of the x axis and on the figure width
+        """
+        return self.bounds(data, 0), self._width
+
+    def figurefooterbox(self, data, labels):
+        """
+        Put the bounds of the x axis beneath the figure
+        :param data: list of (x, y) series
+        :param labels: unused
+        :return: ChartBox object
+        """
+        xmin, xmax = self.bounds(data, 0)
+        return self.boundsfooterbox(str(NiceNumber(xmin)), str(NiceNumber(xmax)), self._width)
+
+    def legendbox(self, labels, legendpos):
+        """
+        Generate the content of the figure's legend box
+        :param labels: legend labels, one per series
+        :param legendpos: legend position, should be 'top', 'bottom' or 'right'
+        :return: ChartBox
+        """
+        return self.colorlegendbox(labels, legendpos, self.colorpalette())
+
+    def yaxis(self, data, ticks, numticks):
+        """
+        Create the y axis
+        :param data: list of (x, y) series
+        :param ticks: y axis ticks settings, 'auto', 'all' or None
+        :param numticks: minimum number of ticks to display, only applies when ticks is 'auto'
+        :return: ChartBox representing the y axis, ordered from the bottom to the top
+        """
+        ycoords, _ = self.ycoordinates(data)
+        return self.axisbox(ycoords, ticks, numticks)
+
+    def plot(self, data, x=None, legend=None, legendpos='right', numticks=5, ticks='auto', title=None):
+        """
+        Create the plot
+        :param data: 1-D sequence of y values, 2-D array or list of 1-D sequences (one per series)
+        :param x: optional x values, either shared by all series or one sequence per series (indices by default)
+        :param legend: optional list of series names
+        :param legendpos: legend position, should be 'top', 'bottom' or 'right'
+        :param numticks: minimum number of ticks to display
+        :param ticks: y axis ticks, should be 'auto' (default), 'all' or None
+        :param title: string, figure title
+        """
+        super(Scatter, self).plot(self.series(data, x), legend=legend, legendpos=legendpos, numticks=numticks,
+                                  ticks=ticks, title=title)
+
+
+class Line(Scatter):
+    """
+    Line chart drawn with braille characters, consecutive points of a series being connected
+    """
+
+    # Max number of interpolated dots processed at once, to keep memory usage bounded
+    _chunk_size = 1 << 20
+
+    def dots(self, x, y, xbounds, ybounds):
+        """
+        Rasterize a series on the dot grid, connecting consecutive points with straight segments
+        Segments with an end point outside the bounds or not finite are not drawn
+        :param x: array of x values
+        :param y: array of y values
+        :param xbounds: (min, max) bounds of the x axis
+        :param ybounds: (min, max) bounds of the y axis
+        :return: 2-D boolean array of dots, rows being ordered from the bottom to the top
+        """
+        px, py, inside = self.project(x, y, xbounds, ybounds)
+        bitmap = np.zeros((4 * self._height, 2 * self._width), dtype=bool)
+        bitmap[py[inside], px[inside]] = True
+        # Only segments spanning more than one dot need intermediate dots
+        dx = np.diff(px)
+        dy = np.diff(py)
+        steps = np.maximum(np.abs(dx), np.abs(dy))
+        segments = np.flatnonzero(inside[:-1] & inside[1:] & (steps > 1))
+        if len(segments) == 0:
+            return bitmap
+        # Process segments by chunks of about _chunk_size dots
+        cumsteps = np.cumsum(steps[segments])
+        bounds = np.searchsorted(cumsteps, np.arange(self._chunk_size, cumsteps[-1], self._chunk_size))
+        for chunk in np.split(segments, np.unique(bounds)):
+            if len(chunk) == 0:
+                continue
+            nsteps = steps[chunk]
+            index = np.repeat(np.arange(len(chunk)), nsteps)
+            offsets = np.arange(len(index)) - np.repeat(np.cumsum(nsteps) - nsteps, nsteps)
+            t = offsets / nsteps[index]
+            seg = chunk[index]
+            bitmap[np.rint(py[seg] + t * dy[seg]).astype(np.int64), np.rint(px[seg] + t * dx[seg]).astype(np.int64)] = True
+        return bitmap
+
+
+class Heatmap(GenericChart):
+    """
+    Heatmap of a 2-D array, each value being drawn as a colored cell
+    Arrays larger than the figure are binned (averaged over blocks of values), binning and coloring being
+    vectorized with NumPy
+    """
+
+    def __init__(self, width=80, height=40, palette='256', cellwidth=2, vmin=None, vmax=None):
+        """
+        :param width: max width of the figure, in characters
+        :param height: max height of the figure, in characters
+        :param palette: '16' (named colors), '256' (xterm color cube) or 'truecolor' (RGB colors)
+        :param cellwidth: number of characters per cell, 2 by default so that cells look roughly square
+        :param vmin: optional value mapped to the lowest color, lower values get the lowest color too
+        :param vmax: optional value mapped to the highest color, higher values get the highest color too
+        """
+        if np is None:
+            raise ImportError('numpy is required for heatmaps')
+        super(Heatmap, self).__init__(height)
+        _heatmap_palette(palette)  # validate the palette name
+        self._width = width
+        self._palette = palette
+        self._cellwidth = cellwidth
+        self._vmin = vmin
+        self._vmax = vmax
+
+    def binning(self, data):
+        """
+        Average values over blocks so that the array fits in the figure, non-finite values being ignored
+        :param data: 2-D array
+        :return values: binned 2-D array, NaN where a block has no finite value
+        :return row_edges: index of the first input row of each block, plus the number of rows
+        :return col_edges: index of the first input column of each block, plus the number of columns
+        """
+        data = np.asarray(data, dtype=float)
+        if data.ndim != 2 or data.size == 0:
+            raise ValueError('heatmap data should be a non-empty 2-D array')
+        num_rows = min(data.shape[0], self._height)
+        num_cols = min(data.shape[1], max(1, self._width // self._cellwidth))
+        row_edges = np.linspace(0, data.shape[0], num_rows + 1).astype(np.int64)
+        col_edges = np.linspace(0, data.shape[1], num_cols + 1).astype(np.int64)
+        finite = np.isfinite(data)
+        sums = np.where(finite, data, 0.0)
+        counts = finite.astype(np.int64)
+        for axis, edges in [(0, row_edges), (1, col_edges)]:
+            sums = np.add.reduceat(sums, edges[:-1], axis=axis)
+            counts = np.add.reduceat(counts, edges[:-1], axis=axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(counts > 0, sums / counts, np.nan)
+        return values, row_edges, col_edges
+
+    def bounds(self, values):
+        """
+        Compute the range of values mapped on the color palette
+        :param values: binned 2-D array
+        :return: (min, max) tuple
+        """
+        finite = values[np.isfinite(values)]
+        vmin = self._vmin if self._vmin is not None else (float(finite.min()) if len(finite) > 0 else 0.0)
+        vmax = self._vmax if self._vmax is not None else (float(finite.max()) if len(finite) > 0 else 1.0)
+        if vmax <= vmin:
+            vmin, vmax = vmin - 0.5, vmin + 0.5
+        return vmin, vmax
+
+    def levels(self, values, bounds):
+        """
+        Map values on the indices of palette colors
+        :param values: array of values
+        :param bounds: (min, max) range of values mapped on the palette
+        :return: integer array of color indices, -1 for non-finite values
+        """
+        num_colors = len(_heatmap_palette(self._palette))
+        with np.errstate(invalid='ignore'):
+            levels = np.floor((values - bounds[0]) / (bounds[1] - bounds[0]) * num_colors)
+        levels = np.clip(np.nan_to_num(levels, nan=-1.0), -1, num_colors - 1).astype(np.int64)
+        levels[np.isfinite(values) & (levels < 0)] = 0
+        return levels
+
+    def figurebox(self, data):
+        """
+        :param data: (values, row_edges, col_edges) tuple, see binning()
+        :return: ChartBox
+        """
+        values = data[0]
+        levels = self.levels(values, self.bounds(values))
+        palette = _heatmap_palette(self._palette)
+        num_rows, num_cols = values.shape
+        grid = CellGrid(num_cols * self._cellwidth, num_rows)
+        sids = [grid.styleid(bg=color) for color in palette]
+        for r in range(num_rows):
+            # The first row of the array is drawn at the top, i.e. on the last row of the grid
+            row = levels[r]
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(row)) + 1))
+            stops = np.append(starts[1:], num_cols)
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                if row[start] >= 0:
+                    grid.fill(start * self._cellwidth, num_rows - 1 - r, (stop - start) * self._cellwidth, ' ',
+                              sids[row[start]])
+        return grid.chartbox()
+
+    def geometry(self, data):
+        """
+        The figure footer only depends on the binning of columns and on the cell width
+        """
+        return tuple(data[2].tolist()), self._cellwidth
+
+    def figurefooterbox(self, data, labels):
+        """
+        Put the indices of the first and last columns beneath the figure
+        :param data: (values, row_edges, col_edges) tuple, see binning()
+        :param labels: unused
+        :return: ChartBox object
+        """
+        col_edges = data[2]
+        return self.boundsfooterbox(str(col_edges[0]), str(col_edges[-1] - 1), (len(col_edges) - 1) * self._cellwidth)
+
+    def legendbox(self, labels, legendpos):
+        """
+        Generate the color bar
+        :param labels: (min, max) range of values mapped on the palette, None for no color bar
+        :param legendpos: legend position, should be 'top', 'bottom' or 'right'
+        :return: ChartBox
+        """
+        legend = ChartBox()
+        if labels is None:
+            return legend
+        palette = _heatmap_palette(self._palette)
+        num_steps = min(len(palette), 10)
+        indices = [int(round(i * (len(palette) - 1) / (num_steps - 1.0))) for i in range(num_steps)]
+        if legendpos == 'right':
+            # Vertical color bar, the highest values on top
+            for i in reversed(indices):
+                value = labels[0] + (labels[1] - labels[0]) * i / float(len(palette))
+                legend.append(RichText(' ' * 3, bg=palette[i]) + ' ' + str(NiceNumber(value)))
+        else:
+            # Horizontal color bar on a single row
+            bar = RichText(str(NiceNumber(labels[0])) + ' ', style='bold')
+            for i in indices:
+                bar += RichText(' ' * 2, bg=palette[i])
+            legend.append(bar + RichText(' ' + str(NiceNumber(labels[1])), style='bold'))
+        return legend
+
+    def yaxis(self, data, ticks, numticks):
+        """
+        Create the y axis, ticks being the indices of the input rows
+        :param data: (values, row_edges, col_edges) tuple, see binning()
+        :param ticks: y axis ticks settings, 'auto', 'all' or None
+        :param numticks: minimum number of ticks to display, only applies when ticks is 'auto'
+        :return: ChartBox representing the y axis, ordered from the bottom to the top
+        """
+        # Coordinates from the bottom to the top, i.e. from the last row of the array to the first one
+        coords = [int(i) for i in reversed(data[1][:-1])]
+        return self.axisbox(coords, ticks, numticks, formatter=str)
+
+    def plot(self, data, colorbar=True, legendpos='right', numticks=5, ticks='auto', title=None):
+        """
+        Create the plot
+        :param data: 2-D array
+        :param colorbar: indicates if a color bar should be displayed as a legend
+        :param legendpos: color bar position, should be 'top', 'bottom' or 'right'
+        :param numticks: minimum number of ticks to display
+        :param ticks: y axis ticks, should be 'auto' (default), 'all' or None
+        :param title: string, figure title
+        """
+        binned = self.binning(data)
+        legend = self.bounds(binned[0]) if colorbar else None
+        super(Heatmap, self).plot(binned, legend=legend, legendpos=legendpos, numticks=numticks, ticks=ticks,
+                                  title=title)
@@ -1,9 +1,22 @@
 #!/usr/bin/python
 
 
+import codecs
 import copy
+import heapq
+import json
+import logging
+import logging.handlers
 import math
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
 import warnings
+from queue import Empty
 try:
 	import colors
 	__flag_use_colors__ = True
@@ -12,6 +25,199 @@ except:
 	raise Warning('ansicolors package is missing, string colors and styles will be disabled')
 
 
+# Display width tables, built on first use by __width_tables__()
+__width_table__ = None  # bytearray of display widths, indexed by code point
+__width_patterns__ = None  # regular expressions matching wide and zero-width characters
+
+
+def __width_tables__():
+	"""
+	Build the display width lookup tables (only once)
+	Widths are computed for the Basic Multilingual Plane and for the emoji blocks; CJK ideographs from the
+	supplementary planes are wide and other characters are assumed to span a single column
+	:return: (width table, wide characters regex, zero-width characters regex) tuple
+	"""
+	global __width_table__, __width_patterns__
+	if __width_table__ is None:
+		table = bytearray(b'\x01') * 0x20000
+		wide = []
+		zero = []
+		for cp in list(range(0x80, 0x10000)) + list(range(0x1F000, 0x1FB00)):
+			char = chr(cp)
+			if unicodedata.combining(char) or unicodedata.category(char) in ['Mn', 'Me', 'Cf']:
+				table[cp] = 0
+				zero.append(cp)
+			elif unicodedata.east_asian_width(char) in ['W', 'F']:
+				table[cp] = 2
+				wide.append(cp)
+
+		def char_class(codepoints, extra=''):
+			# Turn a sorted list of code points into a regex character class made of ranges
+			ranges = []
+			for cp in codepoints:
+				if len(ranges) > 0 and ranges[-1][1] == cp - 1:
+					ranges[-1][1] = cp
+				else:
+					ranges.append([cp, cp])
+			return re.compile('[' + ''.join(re.escape(chr(a)) + '-' + re.escape(chr(b)) for a, b in ranges) + extra + ']')
+
+		__width_patterns__ = (char_class(wide, '\U00020000-\U0003FFFD'), char_class(zero))
+		__width_table__ = table
+	return (__width_table__,) + __width_patterns__
+
+
+def __char_width__(char):
+	"""
+	Display width of a single character
+	"""
+	cp = ord(char)
+	if cp < 0x80:
+		return 1
+	if 0x20000 <= cp <= 0x3FFFD:
+		return 2
+	return __width_tables__()[0][cp] if cp < 0x20000 else 1
+
+
+def __width_index__(text, width):
+	"""
+	Get the length of the longest prefix of a string which does not span more than the input display width
+	:param text: string or RichText object
+	:param width: display width, i.e. number of terminal columns
+	:return: number of characters
+	"""
+	if isinstance(text, RichText):
+		text = text.str()
+	if text.isascii():
+		return max(0, min(len(text), width))
+	total = 0
+	for i, char in enumerate(text):
+		total += __char_width__(char)
+		if total > width:
+			return i
+	return len(text)
+
+
+def display_width(text):
+	"""
+	Compute the display width of a string or RichText object, i.e. the number of terminal columns it spans
+	Wide characters (CJK, emoji) span 2 columns and combining characters don't span any column
+	Pure ASCII strings take a fast path, other strings are handled with precompiled regular expressions
+	:param text: string or RichText object
+	:return: display width
+	"""
+	if isinstance(text, RichText):
+		return text.width()
+	if text.isascii():
+		return len(text)
+	_, wide, zero = __width_tables__()
+	return len(text) + wide.subn('', text)[1] - zero.subn('', text)[1]
+
+
+def __write_varint__(buffer, value):
+	"""
+	Append an unsigned integer to a bytearray using a variable number of bytes (7 bits per byte)
+	"""
+	while value >= 0x80:
+		buffer.append((value & 0x7F) | 0x80)
+		value >>= 7
+	buffer.append(value)
+
+
+def __read_varint__(data, pos):
+	"""
+	Read an unsigned integer written by __write_varint__
+	:return: (value, position of the next byte) tuple
+	"""
+	value = 0
+	shift = 0
+	while True:
+		byte = data[pos]
+		pos += 1
+		value |= (byte & 0x7F) << shift
+		if byte < 0x80:
+			return value, pos
+		shift += 7
+
+
+def __style_key__(style):
+	"""
+	Hashable key of a style dictionary, lists (e.g. RGB colors) are converted to tuples
+	"""
+	return tuple(tuple(style[k]) if isinstance(style[k], list) else style[k] for k in ['fg', 'bg', 'style'])
+
+
+def encode_texts(items):
+	"""
+	Encode a list of strings and RichText objects in a compact binary format
+	The format is made of the UTF-8 texts followed by a table of distinct styles and, for each RichText object,
+	a run-length table of (style id, length) pairs
+	:param items: list of strings and RichText objects
+	:return: bytes
+	"""
+	out = bytearray(b'RT\x01')
+	styles = {}  # style key -> style id
+	runs = bytearray()
+	__write_varint__(out, len(items))
+	for item in items:
+		is_richtext = isinstance(item, RichText)
+		text = (item.str() if is_richtext else item).encode('utf-8', 'surrogatepass')
+		out.append(int(is_richtext))
+		__write_varint__(out, len(text))
+		out += text
+		if is_richtext:
+			__write_varint__(runs, len(item.__sbox__))
+			for sbox in item.__sbox__:
+				key = __style_key__(sbox.__style__)
+				style_id = styles.get(key)
+				if style_id is None:
+					style_id = styles[key] = len(styles)
+				__write_varint__(runs, style_id)
+				__write_varint__(runs, sbox.length)
+	table = json.dumps(list(styles.keys()), separators=(',', ':')).encode('utf-8')
+	__write_varint__(out, len(table))
+	out += table
+	out += runs
+	return bytes(out)
+
+
+def decode_texts(data):
+	"""
+	Decode a list of strings and RichText objects encoded with encode_texts()
+	:param data: bytes
+	:return: list of strings and RichText objects
+	"""
+	if data[:3] != b'RT\x01':
+		raise ValueError('unsupported encoding')
+	num_items, pos = __read_varint__(data, 3)
+	texts = []
+	for _ in range(num_items):
+		is_richtext = data[pos]
+		length, pos = __read_varint__(data, pos + 1)
+		texts.append((is_richtext, data[pos:pos+length].decode('utf-8', 'surrogatepass')))
+		pos += length
+	length, pos = __read_varint__(data, pos)
+	# Style dictionaries are shared by all style boxes using the same style
+	styles = [{'fg': tuple(fg) if isinstance(fg, list) else fg, 'bg': tuple(bg) if isinstance(bg, list) else bg,
+			   'style': style} for fg, bg, style in json.loads(data[pos:pos+length].decode('utf-8'))]
+	pos += length
+	items = []
+	for is_richtext, text in texts:
+		if not is_richtext:
+			items.append(text)
+			continue
+		item = RichText(text)
+		item.__sbox__ = []
+		num_runs, pos = __read_varint__(data, pos)
+		start = 0
+		for _ in range(num_runs):
+			style_id, pos = __read_varint__(data, pos)
+			length, pos = __read_varint__(data, pos)
+			item.__sbox__.append(StyleBox(start, length, styles[style_id]))
+			start += length
+		items.append(item)
+	return items
+
+
 def __overlap__(a, b):
 	"""
 	Compute the overlap between 2 integers intervals
@@ -30,6 +236,35 @@ def __overlap__(a, b):
 	return max(min(a[1], b[1]) - max(a[0], b[0]) + 1, 0)
 
 
+def __inline_pattern__(pattern, flags=0):
+	"""
+	Convert a regular expression into a string embeddable in a larger one, flags being set in an inline group
+	:param pattern: regular expression, as a string or compiled pattern
+	:param flags: regular expression flags, only applies if pattern is a string
+	:return: string
+	"""
+	if not isinstance(pattern, str):
+		pattern, flags = pattern.pattern, pattern.flags
+	if re.compile(pattern, flags).groupindex or re.search(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=)', pattern):
+		raise ValueError('patterns with named groups or back references can\'t be combined: ' + pattern)
+	inline = ''.join(c for flag, c in [(re.ASCII, 'a'), (re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+									   (re.DOTALL, 's'), (re.VERBOSE, 'x')] if flags & flag)
+	return '(?' + inline + ':' + pattern + ')' if len(inline) > 0 else pattern
+
+
+def __stripped__(text):
+	"""
+	Strip a string or RichText object without modifying it, RichText objects may therefore be frozen
+	:param text: string or RichText object
+	:return: stripped string or new RichText object
+	"""
+	if not isinstance(text, RichText):
+		return text.strip()
+	raw = text.str()
+	start = len(raw) - len(raw.lstrip(' '))
+	return text[start:max(start, len(raw.rstrip(' ')))]
+
+
 class StyleBox:
 	"""
 	The StyleBox class implements a style box object defining style options for a certain substring of a string
@@ -99,6 +334,7 @@ class RichText:
 			text = text.str()
 		self.__text__ = text
 		self.__sbox__ = []
+		self.__width__ = None  # cached (text, display width) tuple, see width()
 		if len(text) > 0:
 			# Formatting options are stored in a dictionary under the fg, bg and style keys
 			self.__sbox__ = [StyleBox(0, len(text), {'fg': fg, 'bg': bg, 'style': style})]
@@ -108,8 +344,8 @@ class RichText:
 			other = RichText(other)
 		# For the regular '+' operator, output should be a new object
 		# Left and right hand side members of the operators should not be modified
-		# --> Make a deepcopy of the current object
-		out = copy.deepcopy(self)
+		# --> Make a mutable copy of the current object
+		out = self.copy()
 		out.__rconcat__(other)
 		return out
 
@@ -123,13 +359,54 @@ class RichText:
 			raise Exception('RichText objects may only be concatenated with strings')
 		return RichText(other).__add__(self)
 
+	def __deepcopy__(self, memo):
+		"""
+		Fast deep copy, see copy()
+		Frozen objects are immutable, they are therefore not copied and may be used in copied dictionary keys
+		"""
+		return self if self.is_frozen() else self.copy()
+
+	def __reduce__(self):
+		"""
+		Pickling support, using the compact binary format of to_bytes(), frozen objects stay frozen
+		"""
+		return RichText.from_bytes, (self.to_bytes(), self.is_frozen())
+
+	def copy(self):
+		"""
+		Create a mutable copy of the current object, even if it is frozen
+		Style dictionaries are never modified in place, so they can be shared with the copy
+		:return: new RichText object
+		"""
+		out = RichText.__new__(RichText)
+		out.__dict__.update(self.__dict__)
+		out.__dict__.pop('__frozen__', None)
+		out.__dict__.pop('__hash_value__', None)
+		out.__sbox__ = [StyleBox(sbox.start, sbox.length, sbox.__style__) for sbox in self.__sbox__]
+		return out
+
 	def __apply_formatting__(self):
 		"""
 		Generate the formatted text string with ANSI color and style codes
 		If another package were to be used for generating the formatted string,
-		this is where changes would have to be made
+		this is where changes would have to be made (as well as in iter_render())
+		"""
+		self.__check_style_boxes__()
+		# If the RichText object is empty, just return an empty string
+		if len(self) == 0:
+			return ''
+		# Otherwise create the output string with formatting blocks by joining the different pieces of the string
+		if __flag_use_colors__:
+			out = ''.join(colors.color(self.str()[sbox.start:sbox.start+sbox.length],
+									   fg=sbox.fg(), bg=sbox.bg(), style=sbox.style()) for sbox in self.__sbox__)
+			return out
+		else:
+			return self.str()
+
+	def __check_style_boxes__(self):
+		"""
+		A few sanity checks to make sure the style boxes properties are properly set before rendering
 		"""
-		# Start with a few sanity checks to make sure the style boxes properties are properly set
 		# - check all style boxes have strictly positive lengths
 		if len(self) > 0 and sum(1 for sbox in self.__sbox__ if sbox.length <= 0) > 0:
 			raise Exception('found style box(es) with negative length')
@@ -143,27 +420,15 @@ class RichText:
 		if sum(1 for i in range(len(self.__sbox__)-1)
 			   if self.__sbox__[i+1].start != self.__sbox__[i].start + self.__sbox__[i].length) > 0:
 			raise Exception('invalid start indices')
-		# If the RichText object is empty, just return an empty string
-		if len(self) == 0:
-			return ''
-		# Otherwise create the output string with formatting blocks by joining the different pieces of the string
-		if __flag_use_colors__:
-			out = ''.join(colors.color(self.str()[sbox.start:sbox.start+sbox.length],
-									   fg=sbox.fg(), bg=sbox.bg(), style=sbox.style()) for sbox in self.__sbox__)
-			return out
-		else:
-			return self.str()
 
 	def __clean_style_boxes__(self):
 		"""
 		After multiple transformations, we might end up in a situation where several consecutives style boxes
 		actually share the same properties and could be merged
-		This is the purpose of this method
-		It is especially useful for ensuring that equality tests return the expected result
-		Indeed, since equality tests compare formatted strings, formatted blocks have to be set the same way
-		in the compared RichText objects
+		This is the purpose of this method, which produces shorter formatted strings
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		if len(self.__sbox__) <= 1:
 			return self
 		# Loop over style boxes
@@ -185,15 +450,127 @@ class RichText:
 			is_finished = i == len(self.__sbox__) - 1
 		return self
 
+	def __extract__(self, ranges):
+		"""
+		Extract several substrings with preserved formatting, walking the style boxes only once
+		:param ranges: iterable of (start, stop) index tuples, sorted in ascending order
+		:return: list of RichText objects
+		"""
+		return list(self.__iextract__(ranges))
+
+	def __iextract__(self, ranges):
+		"""
+		Lazy version of __extract__(), substrings are generated one by one
+		:param ranges: iterable of (start, stop) index tuples, sorted in ascending order
+		:return: generator of RichText objects
+		"""
+		boxes = self.__sbox__
+		i = 0  # index of the first style box which may overlap the current range
+		for start, stop in ranges:
+			piece = RichText(self.__text__[start:stop])
+			piece.__sbox__ = []
+			# Skip style boxes ending before the range
+			while i < len(boxes) and boxes[i].start + boxes[i].length <= start:
+				i += 1
+			# Copy the overlapping part of style boxes spanning over the range
+			j = i
+			while j < len(boxes) and boxes[j].start < stop:
+				lo = max(start, boxes[j].start)
+				hi = min(stop, boxes[j].start + boxes[j].length)
+				if hi > lo:
+					piece.__sbox__.append(StyleBox(lo - start, hi - lo, boxes[j].__style__))
+				j += 1
+			yield piece
+
+	def __overlay__(self, ranges):
+		"""
+		Apply style options to ranges of characters, in a single sweep over style boxes and ranges
+		Options set to None in a range keep the underlying style box value
+		Style dictionaries are never modified in place, resulting style boxes may therefore share them
+		:param ranges: list of (start, stop, style) tuples, sorted and non-overlapping,
+			style being a dictionary with 'fg', 'bg' and 'style' keys
+		:return: self, modified
+		"""
+		self.__check_frozen__()
+		sboxes = []
+		merged_styles = {}  # (id of the style box style, id of the range style) -> merged style
+		last_style = None  # style of the last style box in the output list
+		i = 0  # index of the current range
+		num_ranges = len(ranges)
+		for sbox in self.__sbox__:
+			cursor = sbox.start
+			stop = cursor + sbox.length
+			box_style = sbox.__style__
+			while i < num_ranges and ranges[i][0] < stop:
+				rstart, rstop, rstyle = ranges[i]
+				if rstart < cursor:
+					rstart = cursor
+				if rstop > stop:
+					rstop = stop
+				if rstart > cursor:
+					# Unmodified part of the style box before the range
+					if last_style is box_style or last_style == box_style:
+						sboxes[-1].length += rstart - cursor
+					else:
+						sboxes.append(StyleBox(cursor, rstart - cursor, box_style))
+						last_style = box_style
+				if rstop > rstart:
+					key = (id(box_style), id(rstyle))
+					style = merged_styles.get(key)
+					if style is None:
+						style = merged_styles[key] = {k: box_style[k] if rstyle.get(k) is None else rstyle[k]
+													  for k in ['fg', 'bg', 'style']}
+					if last_style is style or last_style == style:
+						sboxes[-1].length += rstop - rstart
+					else:
+						sboxes.append(StyleBox(rstart, rstop - rstart, style))
+						last_style = style
+					cursor = rstop
+				if ranges[i][1] > stop:
+					# The range spans over the next style box too
+					break
+				i += 1
+			if cursor < stop:
+				if last_style is box_style or last_style == box_style:
+					sboxes[-1].length += stop - cursor
+				else:
+					sboxes.append(StyleBox(cursor, stop - cursor, box_style))
+					last_style = box_style
+		self.__sbox__ = sboxes
+		return self
+
+	@staticmethod
+	def __from_runs__(runs):
+		"""
+		Create a RichText object from a list of text runs, consecutive runs sharing the same style are merged
+		:param runs: iterable of (text, style) tuples, style being a dictionary with 'fg', 'bg' and 'style' keys
+		:return: RichText object
+		"""
+		out = RichText('')
+		texts = []
+		start = 0
+		for text, style in runs:
+			if len(text) == 0:
+				continue
+			texts.append(text)
+			if len(out.__sbox__) > 0 and out.__sbox__[-1].__style__ == style:
+				out.__sbox__[-1].length += len(text)
+			else:
+				out.__sbox__.append(StyleBox(start, len(text), dict(style)))
+			start += len(text)
+		out.__text__ = ''.join(texts)
+		return out
+
 	def __lconcat__(self, other):
 		"""
 		Left-side concatenation (other + self) with another RichText object
 		:param other: left hand side RichText object
 		:return self
 		"""
+		self.__check_frozen__()
 		# Here we want to modify the current object but not the other object
-		# --> Make a deepcopy of the other object
-		other_copy = copy.deepcopy(other)
+		# --> Make a copy of the other object
+		other_copy = other.copy()
 		# Shift style boxes of the current object,
 		# i.e. add the length of the other object to the start indices of the current object's style boxes
 		for s in self.__sbox__:
@@ -209,9 +586,10 @@ class RichText:
 		:param other: right hand side RichText object
 		:return self
 		"""
+		self.__check_frozen__()
 		# Here we want to modify the current object but not the other object
-		# --> Make a deepcopy of the object object
-		other_copy = copy.deepcopy(other)
+		# --> Make a copy of the other object
+		other_copy = other.copy()
 		# Shift style boxes of the other object,
 		# i.e. add the length of the current object to the start indices of the other object's style boxes
 		for s in other_copy.__sbox__:
@@ -221,13 +599,88 @@ class RichText:
 		self.__sbox__ = self.__sbox__ + other_copy.__sbox__
 		return self
 
+	def __check_frozen__(self):
+		"""
+		Raise a TypeError if the current object is frozen
+		Methods modifying the object call it before any change, style boxes being edited in place
+		"""
+		if self.__dict__.get('__frozen__', False):
+			raise TypeError('frozen RichText objects may not be modified, use copy() first')
+
+	def __runs__(self):
+		"""
+		Canonical form of the formatting, without modifying the current object
+		Consecutive style boxes sharing the same properties are merged, so that objects rendering the same way
+		have the same runs whatever transformations they went through
+		The canonical form is computed on demand instead of being maintained by every transformation,
+		the hash value of frozen objects being cached, see __hash__()
+		:return: tuple of (length, style key) tuples
+		"""
+		runs = []
+		last_style = None
+		last_key = None
+		for sbox in self.__sbox__:
+			if sbox.__style__ is not last_style:
+				last_style = sbox.__style__
+				key = __style_key__(last_style)
+				if key != last_key:
+					runs.append([sbox.length, key])
+					last_key = key
+					continue
+			runs[-1][0] += sbox.length
+		return tuple((length, key) for length, key in runs)
+
 	def __eq__(self, other):
 		"""
-		Equality test
+		Equality test, neither object is modified
+		Unformatted texts are compared first, then the canonical forms of the formatting, see __runs__()
 		:param other: RichText object
 		:return: True if formatted strings of both objects are equal, false else
 		"""
-		return str(self.__clean_style_boxes__()) == str(other.__clean_style_boxes__())
+		if not isinstance(other, RichText):
+			return NotImplemented
+		if self is other:
+			return True
+		return self.__text__ == other.__text__ and self.__runs__() == other.__runs__()
+
+	def __hash__(self):
+		"""
+		Only frozen RichText objects are hashable, see freeze()
+		The hash value is computed from the canonical form on the first call and then cached
+		"""
+		if not self.__dict__.get('__frozen__', False):
+			raise TypeError("unhashable type: 'RichText' (use freeze() first)")
+		if self.__dict__.get('__hash_value__') is None:
+			self.__hash_value__ = hash((self.__text__, self.__runs__()))
+		return self.__hash_value__
+
+	def freeze(self):
+		"""
+		Make the current object immutable, and hence hashable (e.g. for using it as a dictionary key)
+		Methods modifying a frozen object raise a TypeError, copies made with copy() are mutable again
+		Frozen objects stay frozen when pickled, and copy.deepcopy() returns them as is
+		:return: self
+		"""
+		self.__frozen__ = True
+		return self
+
+	def is_frozen(self):
+		"""
+		Indicate if the current object is frozen, see freeze()
+		"""
+		return self.__dict__.get('__frozen__', False)
+
+	def width(self):
+		"""
+		Return the display width of the RichText object, i.e. the number of terminal columns it spans
+		Contrarily to the length, wide characters (CJK, emoji) count twice and combining characters don't count
+		The width is cached until the text changes
+		:return: display width
+		"""
+		text = self.__text__
+		if self.__width__ is None or self.__width__[0] is not text:
+			self.__width__ = (text, display_width(text))
+		return self.__width__[1]
 
 	def __getitem__(self, key):
 		"""
@@ -243,13 +696,13 @@ class RichText:
 		# Transform key into a slice if it is an integer
 		key_slice = key
 		if isinstance(key, int):
+			key = key + len(self) if key < 0 else key
 			key_slice = slice(key, key+1)
 		# Now check the step
 		if key_slice.step is None or key_slice.step == 1:
-			# If the step is None or 1, just crop the unnecessary leading and trailing characters
+			# If the step is None or 1, extract the substring walking the style boxes once
 			start, stop = key_slice.indices(len(self))[0:2]
-			out = copy.deepcopy(self)
-			out.__lcrop__(start).__rcrop__((len(self) - stop) % len(self))
+			out = self.__extract__([(start, max(start, stop))])[0]
 		else:
 			# Otherwise we have to extract characters individually
 			raise Exception('not implemented yet')
@@ -283,6 +736,7 @@ class RichText:
 		:param numchars: number of characters to remove
 		:return: self
 		"""
+		self.__check_frozen__()
 		# Deal with edge cases
 		if self.__crop_edgecases__(numchars):
 			return self
@@ -317,6 +771,7 @@ class RichText:
 		:param numchars: number of characters to remove
 		:return self
 		"""
+		self.__check_frozen__()
 		# Deal with edge cases
 		if self.__crop_edgecases__(numchars):
 			return self
@@ -340,6 +795,7 @@ class RichText:
 		return self
 
 	def __setitem__(self, key, value):
+		self.__check_frozen__()
 		if not isinstance(value, str):
 			raise TypeError('expects a string as input')
 		# Transform key into a slice if it is an integer
@@ -368,6 +824,7 @@ class RichText:
 		"""
 		Extension of the built-in string capitalize() method
 		"""
+		self.__check_frozen__()
 		self.replaceall(self.str().capitalize())
 		return self
 
@@ -376,6 +833,7 @@ class RichText:
 		Extension of the built-in string casefold() method
 		:return: self modified
 		"""
+		self.__check_frozen__()
 		try:
 			self.replaceall(self.str().casefold())
 		except:
@@ -398,13 +856,14 @@ class RichText:
 			in a centered string pushed to the right. Setting this flag to True allows to push it to the left
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		# Do a dummy call to the built-in method to validate input arguments
 		_ = self.str().center(width, fillchar)
-		# If the current object is longer than the desired width, don't do anything
-		if width <= len(self):
+		# If the current object is wider than the desired width, don't do anything
+		if width <= self.width():
 			return self
 		# Num characters to add at the left and right ends of the string
-		num_chars_to_add = width - len(self)
+		num_chars_to_add = width - self.width()
 		num_chars_left = int(math.floor(num_chars_to_add * 0.5) if pushleft else math.ceil(num_chars_to_add * 0.5))
 		num_chars_right = num_chars_to_add - num_chars_left
 		# Append fill characters to both ends
@@ -415,46 +874,180 @@ class RichText:
 	def expandtabs(self, tabsize=8):
 		"""
 		Extension of the built-in string expandtabs method
-		:param tabsize: number of spaces characters used to replace a single tab character
+		Tabs are replaced up to the next tab stop, the column being reset after each newline, exactly like str.expandtabs()
+		Text and style boxes are walked only once
+		:param tabsize: distance between two tab stops
 		:return: self modified
 		"""
+		self.__check_frozen__()
 		# Do a dummy call to the built-in method to validate input arguments
-		_ = self.str().expandtabs(tabsize)
-		# Find tab characters
-		is_finished = False
-		while not is_finished:
-			tabidx = self.str().find('\t')
-			is_finished = tabidx == -1
-			if not is_finished:
-				# Actually expand the current tab
-				self.__text__ = self.str()[:tabidx] + (' ' * tabsize) + self.str()[tabidx+1:]
-				# Loop over style boxes
-				sbox_idx = -1
-				for i in range(len(self.__sbox__)):
-					# Get the index of the style box that includes tabidx
-					# Increase this style box's length
-					if self.__sbox__[i].contains(tabidx):
-						self.__sbox__[i].length += tabsize - len('\t')
-						sbox_idx = i
-					# Shift the subsequent style boxes start indices
-					if sbox_idx != -1 and i > sbox_idx:
-						self.__sbox__[i].start += tabsize - len('\t')
+		_ = ''.expandtabs(tabsize)
+		text = self.str()
+		if '\t' not in text:
+			return self
+		# Expand tabs, remembering the cumulative shift introduced after each of them
+		pieces = []
+		shifts = []  # (index of the tab in the input string, total shift after this tab)
+		last = 0  # start index of the text not copied yet
+		line_start = 0  # index of the first character of the current line in the input string
+		line_shift = 0  # shift introduced by the tabs of the current line
+		shift = 0
+		for match in re.finditer('[\t\n\r]', text):
+			idx = match.start()
+			if match.group(0) != '\t':
+				line_start = idx + 1
+				line_shift = 0
+				continue
+			num_spaces = tabsize - (idx - line_start + line_shift) % tabsize if tabsize > 0 else 0
+			pieces.append(text[last:idx])
+			pieces.append(' ' * num_spaces)
+			last = idx + 1
+			line_shift += num_spaces - 1
+			shift += num_spaces - 1
+			shifts.append((idx, shift))
+		pieces.append(text[last:])
+		self.__text__ = ''.join(pieces)
+		# Remap style boxes, their boundaries being sorted the shifts are walked only once
+		i = 0
+		shift = 0
+
+		def remap(pos):
+			nonlocal i, shift
+			while i < len(shifts) and shifts[i][0] < pos:
+				shift = shifts[i][1]
+				i += 1
+			return pos + shift
+
+		sboxes = []
+		for sbox in self.__sbox__:
+			start = remap(sbox.start)
+			stop = remap(sbox.start + sbox.length)
+			if stop > start:
+				sboxes.append(StyleBox(start, stop - start, sbox.__style__))
+		self.__sbox__ = sboxes
 		return self
 
+	@staticmethod
+	def from_bytes(data, frozen=False):
+		"""
+		Create a RichText object from its compact binary representation, see to_bytes()
+		:param data: bytes
+		:param frozen: True for freezing the created object, see freeze()
+		:return: RichText object
+		"""
+		items = decode_texts(data)
+		if len(items) != 1 or not isinstance(items[0], RichText):
+			raise ValueError('data does not encode a single RichText object')
+		return items[0].freeze() if frozen else items[0]
+
+	@staticmethod
+	def from_ansi(data, encoding='utf-8'):
+		"""
+		Create a RichText object from a string or bytes with ANSI color and style codes
+		:param data: string or bytes, typically the output of a tool producing colored text
+		:param encoding: encoding used for decoding bytes
+		:return: RichText object
+		"""
+		return AnsiParser(encoding).feed(data, final=True)
+
+	def highlight(self, pattern, fg=None, bg=None, style=None, flags=0):
+		"""
+		Apply style options to all matches of a regular expression
+		Options left to None keep the current formatting of the matched characters
+		:param pattern: regular expression, as a string or compiled pattern
+		:param fg: optional foreground color
+		:param bg: optional background color
+		:param style: optional font style
+		:param flags: regular expression flags, only applies if pattern is a string
+		:return: self, modified
+		"""
+		self.__check_frozen__()
+		if len(self) == 0:
+			return self
+		regex = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+		style = {'fg': fg, 'bg': bg, 'style': style}
+		return self.stylize_ranges([(m.start(), m.end(), style) for m in regex.finditer(self.str())])
+
+	def highlight_many(self, patterns, flags=0):
+		"""
+		Apply style options to all matches of several regular expressions
+		Patterns are compiled into a single alternation, so that the text is scanned only once;
+		when several patterns match at the same position, the first one in the list wins
+		The flags of compiled patterns are kept as inline flags, patterns using named groups or back references
+		can't be combined and raise a ValueError, use highlight() for them
+		:param patterns: list of (pattern, style) tuples, style being a dictionary with optional 'fg', 'bg'
+			and 'style' keys
+		:param flags: regular expression flags, only apply to patterns given as strings
+		:return: self, modified
+		"""
+		self.__check_frozen__()
+		if len(patterns) == 0 or len(self) == 0:
+			return self
+		alternation = re.compile('|'.join('(?P<_h' + str(i) + '>' + __inline_pattern__(p, flags) + ')'
+										  for i, (p, _) in enumerate(patterns)))
+		# Map the index of each pattern's enclosing group to the pattern's style
+		styles = {alternation.groupindex['_h' + str(i)]: {'fg': st.get('fg'), 'bg': st.get('bg'), 'style': st.get('style')}
+				  for i, (_, st) in enumerate(patterns)}
+		ranges = [(m.start(), m.end(), styles[m.lastindex]) for m in alternation.finditer(self.str())]
+		return self.stylize_ranges(ranges)
+
+	def iter_render(self, chunk_size=65536, encoding=None):
+		"""
+		Generate the formatted text with ANSI color and style codes chunk by chunk, see __str__()
+		Memory usage is bounded by the chunk size instead of the size of the whole formatted text
+		:param chunk_size: approximate number of characters per chunk
+		:param encoding: optional encoding, chunks are yielded as bytes if set and as strings otherwise
+		:return: generator of strings or bytes
+		"""
+		self.__check_style_boxes__()
+		text = self.str()
+		pieces = []
+		size = 0
+		for sbox in self.__sbox__:
+			start, stop = sbox.start, sbox.start + sbox.length
+			# Style boxes longer than a chunk are split in pieces, formatting codes being repeated for each of them
+			for k in (range(start, stop, chunk_size) if stop - start > chunk_size else [start]):
+				piece = text[k:min(stop, k + chunk_size)]
+				if __flag_use_colors__:
+					piece = colors.color(piece, fg=sbox.fg(), bg=sbox.bg(), style=sbox.style())
+				pieces.append(piece)
+				size += len(piece)
+				if size >= chunk_size:
+					chunk = ''.join(pieces)
+					yield chunk if encoding is None else chunk.encode(encoding)
+					pieces = []
+					size = 0
+		if len(pieces) > 0:
+			chunk = ''.join(pieces)
+			yield chunk if encoding is None else chunk.encode(encoding)
+
 	def join(self, iterable):
 		"""
 		Extension of the built-in string join() method
-		:param iterable: iterable object to join
+		Texts and style boxes are gathered in a single pass, without copying intermediate results
+		:param iterable: iterable of strings and RichText objects
 		:return: RichText object
 		"""
-		# Deal with the edge case where iterable is empty
-		if len(iterable) == 0:
-			return RichText('')
-		# Deal with the normal case
-		separator = copy.deepcopy(self)
-		out = copy.deepcopy(iterable[0])
-		for i in range(1, len(iterable)):
-			out += separator + copy.deepcopy(iterable[i])
+		texts = []
+		sboxes = []
+		offset = 0
+		plain_style = {'fg': None, 'bg': None, 'style': None}
+		for i, item in enumerate(iterable):
+			for piece in ([self, item] if i > 0 else [item]):
+				if isinstance(piece, RichText):
+					text = piece.str()
+					sboxes += [StyleBox(sbox.start + offset, sbox.length, sbox.__style__) for sbox in piece.__sbox__]
+				elif isinstance(piece, str):
+					text = piece
+					if len(text) > 0:
+						sboxes.append(StyleBox(offset, len(text), plain_style))
+				else:
+					raise TypeError('sequence item ' + str(i) + ': expected str or RichText instance')
+				texts.append(text)
+				offset += len(text)
+		out = RichText('')
+		out.__text__ = ''.join(texts)
+		out.__sbox__ = sboxes
 		return out
 
 	def ljust(self, width, fillchar=' ', fg=None, bg=None, style=None):
@@ -467,13 +1060,14 @@ class RichText:
 		:param style: optional font style options for fill characters
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		# Do a dummy call to the built-in method to validate input arguments
 		_ = self.str().ljust(width, fillchar)
 		# Deal with edge cases
-		if width <= len(self):
+		if width <= self.width():
 			return self
 		# Append fill characters to the right end
-		self.__rconcat__(RichText(fillchar * (width - len(self)), fg, bg, style))
+		self.__rconcat__(RichText(fillchar * (width - self.width()), fg, bg, style))
 		return self
 
 	def rjust(self, width, fillchar=' ', fg=None, bg=None, style=None):
@@ -486,13 +1080,14 @@ class RichText:
 		:param style: optional font style options for fill characters
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		# Do a dummy call to the built-in method to validate input arguments
 		_ = self.str().rjust(width, fillchar)
 		# Deal with edge cases
-		if width <= len(self):
+		if width <= self.width():
 			return self
 		# Append fill characters to the left end
-		self.__lconcat__(RichText(fillchar * (width - len(self)), fg, bg, style))
+		self.__lconcat__(RichText(fillchar * (width - self.width()), fg, bg, style))
 		return self
 
 	def lower(self):
@@ -500,6 +1095,7 @@ class RichText:
 		Extension of the built-in string lower() method
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		self.replaceall(self.str().lower())
 		return self
 
@@ -511,6 +1107,7 @@ class RichText:
 		:param count: max number of times replacement should be done, by default all occurrences are replaced
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		# Do a dummy call to the built-in method to validate input arguments
 		_ = self.str().replace(old, new, count)
 		# Deal with edge cases
@@ -598,6 +1195,7 @@ class RichText:
 		:param string: replacement string
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		if not isinstance(string, str) or len(string) != len(self):
 			raise Exception('replacement may only occur with another string of the same size')
 		self.__text__ = string
@@ -616,6 +1214,7 @@ class RichText:
 		:param chars: characters to remove, whitespace by default
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		return self.lstrip(chars).rstrip(chars)
 
 	def lstrip(self, chars=' '):
@@ -624,6 +1223,7 @@ class RichText:
 		:param chars: characters to remove, whitespace by default
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		num_chars_to_remove = len(self) - len(self.str().lstrip(chars))
 		self.__lcrop__(num_chars_to_remove)
 		return self
@@ -634,58 +1234,199 @@ class RichText:
 		:param chars: characters to remove, whitespace by default
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		num_chars_to_remove = len(self) - len(self.str().rstrip(chars))
 		self.__rcrop__(num_chars_to_remove)
 		return self
 
+	def isplit(self, sep=' ', maxsplit=-1):
+		"""
+		Lazy version of split(), pieces are generated one by one
+		This allows tokenizing very large RichText objects (e.g. line by line) without creating all pieces at once
+		:param sep: separator to use when splitting, whitespace by default, None for splitting on runs of whitespaces
+		:param maxsplit: how many splits to do, all occurrences of 'sep' by default
+		:return: generator of RichText objects
+		"""
+		# Do a dummy call to the built-in method to validate input arguments
+		_ = ''.split(sep, maxsplit)
+		return self.__iextract__(self.__split_ranges__(sep, maxsplit))
+
+	def __split_ranges__(self, sep, maxsplit):
+		"""
+		Generate the (start, stop) indices of the pieces resulting from a split, see isplit()
+		"""
+		text = self.str()
+		if sep is None:
+			# Split on runs of whitespaces, the remaining text after the last split is kept as is
+			for num, match in enumerate(re.finditer('\\S+', text)):
+				if num == maxsplit:
+					yield match.start(), len(text)
+					return
+				yield match.span()
+			return
+		cursor = 0
+		num = 0
+		while num != maxsplit:
+			idx = text.find(sep, cursor)
+			if idx == -1:
+				break
+			yield cursor, idx
+			cursor = idx + len(sep)
+			num += 1
+		yield cursor, len(text)
+
 	def split(self, sep=' ', maxsplit=-1):
 		"""
 		Extension of the built-in string split() method
-		:param sep: separator to use when splitting, whitespace by default
+		Text and style boxes are walked only once
+		:param sep: separator to use when splitting, whitespace by default, None for splitting on runs of whitespaces
 		:param maxsplit: how many splits to do, all occurrences of 'sep' by default
 		:return: list of RichText objects
 		"""
-		# Call the built-in split method on the unformatted text string
-		pieces = self.str().split(sep, maxsplit)
-		# We now have to loop over the resulting pieces and to apply the right style boxes to them
-		cursor = 0  # cursor in the input string
-		for idx in range(len(pieces)):
-			pc = pieces[idx]
-			# If the current piece is empty, replace it with an empty RichText object and go to the next piece
-			if len(pc) == 0:
-				pieces[idx] = RichText('')
-				cursor += len(sep)
+		return list(self.isplit(sep, maxsplit))
+
+	def wrap(self, width, indent='', subsequent_indent=''):
+		"""
+		Wrap the text so that every line spans at most 'width' columns, preserving formatting
+		Lines are filled greedily with whole words, words wider than a line are broken
+		Newline characters force line breaks
+		Text and style boxes are walked only once
+		:param width: max display width of the lines, indent included
+		:param indent: string or RichText object put in front of the first line
+		:param subsequent_indent: string or RichText object put in front of the other lines (hanging indent)
+		:return: list of RichText objects, one per line
+		"""
+		text = self.str()
+		ranges = []  # (start, stop) indices of the lines
+		line_start = None  # start index of the current line, None if it is empty
+		line_stop = 0
+		line_width = 0
+		avail = width - display_width(indent)
+		for match in re.finditer('\n|\\S+', text):
+			if match.group(0) == '\n':
+				# Forced line break
+				ranges.append((line_start, line_stop) if line_start is not None else (match.start(), match.start()))
+				line_start = None
+				avail = width - display_width(subsequent_indent)
+				continue
+			start, stop = match.span()
+			word_width = display_width(match.group(0))
+			gap = display_width(text[line_stop:start]) if line_start is not None else 0
+			if line_start is not None and line_width + gap + word_width <= avail:
+				# The word fits on the current line
+				line_stop = stop
+				line_width += gap + word_width
 				continue
-			# At this point, we know the current piece is not empty
-			# Get its interval in the input string
-			interval = [cursor, cursor + len(pc) - 1]
-			# For each piece, we have to create the list of style boxes
-			# --> initialize an empty list of style boxes and set the start index to zero
-			pc_sbox = []
-			start_idx = 0
-			# Look for style boxes than span over the current piece
-			for sbox in self.__sbox__:
-				overlap = __overlap__(interval, sbox.interval())
-				if overlap > 0:
-					# Copy the style box, adjust its properties and append it to the list of style boxes
-					sbox_copy = copy.deepcopy(sbox)
-					sbox_copy.start = start_idx
-					sbox_copy.length = overlap
-					pc_sbox.append(sbox_copy)
-					# Increase the start index
-					start_idx += sbox_copy.length
-			# Finally replace the current piece with a RichText object
-			pieces[idx] = RichText(pc)
-			pieces[idx].__sbox__ = pc_sbox
-			# Increase the cursor value
-			cursor += len(pc) + len(sep)
-		return pieces
+			if line_start is not None:
+				# Start a new line
+				ranges.append((line_start, line_stop))
+				avail = width - display_width(subsequent_indent)
+			# Break words wider than a line
+			while word_width > avail and stop - start > 1:
+				cut = start + max(1, __width_index__(text[start:stop], avail))
+				ranges.append((start, cut))
+				avail = width - display_width(subsequent_indent)
+				word_width -= display_width(text[start:cut])
+				start = cut
+			line_start, line_stop, line_width = start, stop, word_width
+		if line_start is not None:
+			ranges.append((line_start, line_stop))
+		lines = self.__extract__(ranges)
+		for i, line in enumerate(lines):
+			prefix = indent if i == 0 else subsequent_indent
+			if len(prefix) > 0:
+				line.__lconcat__(prefix if isinstance(prefix, RichText) else RichText(prefix))
+		return lines
+
+	def fill(self, width, indent='', subsequent_indent=''):
+		"""
+		Wrap the text and join the lines with newline characters, see wrap()
+		:param width: max display width of the lines, indent included
+		:param indent: string or RichText object put in front of the first line
+		:param subsequent_indent: string or RichText object put in front of the other lines (hanging indent)
+		:return: RichText object
+		"""
+		return RichText('\n').join(self.wrap(width, indent, subsequent_indent))
+
+	def stylize_ranges(self, ranges, layer='over'):
+		"""
+		Apply style options to many ranges of characters at once
+		Ranges may overlap: when they do, ranges coming later in the list are layered on top of earlier ones
+		The layering rule defines how ranges combine with the current formatting:
+		- 'over': options set in ranges replace current options
+		- 'under': options set in ranges only apply where current options are None
+		Options left to None in a range are transparent
+		Ranges are resolved with a sweep line over range boundaries and style boxes, keeping one heap of active ranges
+		per style option, in O((n + k) log k) for n style boxes and k ranges
+		:param ranges: iterable of (start, stop, style) tuples, style being a dictionary with optional 'fg', 'bg'
+			and 'style' keys; indices are clipped to the string boundaries
+		:param layer: layering rule, should be 'over' or 'under'
+		:return: self, modified, with normalized style boxes
+		"""
+		self.__check_frozen__()
+		if layer not in ['over', 'under']:
+			raise ValueError('layering rule should be \'over\' or \'under\'')
+		keys = ['fg', 'bg', 'style']
+		# Make sure all style dictionaries define all options, converting each distinct dictionary only once
+		converted = {}
+		ranges = list(ranges)
+		for _, _, style in ranges:
+			if id(style) not in converted:
+				converted[id(style)] = {k: style.get(k) for k in keys}
+		ranges = [(max(0, start), min(len(self), stop), converted[id(style)]) for start, stop, style in ranges]
+		ranges = [r for r in ranges if r[1] > r[0]]
+		if len(ranges) == 0:
+			return self
+		# Fast path: sorted, non-overlapping ranges laid over the current formatting
+		if layer == 'over' and all(ranges[i][1] <= ranges[i+1][0] for i in range(len(ranges) - 1)):
+			return self.__overlay__(ranges)
+		# Range starts in ascending order, range boundaries and style box boundaries are the sweep line positions
+		order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+		positions = sorted(set([r[0] for r in ranges] + [r[1] for r in ranges] +
+							   [sbox.start for sbox in self.__sbox__] + [len(self)]))
+		heaps = {k: [] for k in keys}  # option -> heap of (-range index, stop) tuples for active ranges setting it
+		styles = {}  # style key -> style dictionary, shared by resulting style boxes
+		sboxes = []
+		j = 0  # index in the sorted list of ranges
+		b = 0  # index of the current style box
+		for p in range(len(positions) - 1):
+			start, stop = positions[p], positions[p+1]
+			# Activate ranges starting here
+			while j < len(order) and ranges[order[j]][0] <= start:
+				i = order[j]
+				for k in keys:
+					if ranges[i][2][k] is not None:
+						heapq.heappush(heaps[k], (-i, ranges[i][1]))
+				j += 1
+			# Move to the style box containing the current position
+			while self.__sbox__[b].start + self.__sbox__[b].length <= start:
+				b += 1
+			box_style = self.__sbox__[b].__style__
+			# Resolve each option: drop ranges that have ended, then take the top-most active one
+			values = []
+			for k in keys:
+				heap = heaps[k]
+				while len(heap) > 0 and heap[0][1] <= start:
+					heapq.heappop(heap)
+				value = ranges[-heap[0][0]][2][k] if len(heap) > 0 else None
+				if value is None or (layer == 'under' and box_style[k] is not None):
+					value = box_style[k]
+				values.append(value)
+			style = dict(zip(keys, values))
+			style = styles.setdefault(__style_key__(style), style)
+			if len(sboxes) > 0 and sboxes[-1].__style__ is style:
+				sboxes[-1].length += stop - start
+			else:
+				sboxes.append(StyleBox(start, stop - start, style))
+		self.__sbox__ = sboxes
+		return self
 
 	def swapcase(self):
 		"""
 		Extension of the built-in string swapcase() method
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		self.replaceall(self.str().swapcase())
 		return self		
 
@@ -694,18 +1435,166 @@ class RichText:
 		Extension of the built-in string title() method
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		self.replaceall(self.str().title())
 		return self
 
+	def to_bytes(self):
+		"""
+		Compact binary representation: UTF-8 text followed by a run-length table of interned style ids
+		:return: bytes
+		"""
+		return encode_texts([self])
+
+	def write_to(self, fileobj, chunk_size=65536, encoding=None):
+		"""
+		Write the formatted text to a file object chunk by chunk, see iter_render()
+		:param fileobj: file object, opened in binary mode if an encoding is set
+		:param chunk_size: approximate number of characters per chunk
+		:param encoding: optional encoding
+		:return: self
+		"""
+		fileobj.writelines(self.iter_render(chunk_size, encoding))
+		return self
+
 	def upper(self):
 		"""
 		Extension of the built-in string title() method
 		:return: self, modified
 		"""
+		self.__check_frozen__()
 		self.replaceall(self.str().upper())
 		return self
 
 
+class AnsiParser:
+	"""
+	Incremental parser turning text with ANSI SGR codes (colors and styles) into RichText objects
+	The parser keeps its state (current style, incomplete escape sequences, incomplete multi-byte characters)
+	across chunks, so that a stream such as a subprocess pipe can be consumed chunk by chunk in linear time:
+		parser = AnsiParser()
+		for chunk in iter(lambda: proc.stdout.read(4096), b''):
+			printer.print(parser.feed(chunk))
+	Escape sequences other than SGR are removed: CSI sequences (cursor moves, erasing...), string sequences
+	such as OSC window titles or hyperlinks (terminated by BEL or ST) and ESC sequences such as charset selection
+	"""
+
+	# Complete escape sequence: CSI (SGR sequences end with 'm'), OSC/DCS/SOS/PM/APC string or other ESC sequence
+	__escape__ = re.compile('\x1b(?:\\[([0-?]*)[ -/]*([@-~])|[]PX^_][^\x07\x1b]*(?:\x07|\x1b\\\\)|[ -/]*[0-~])')
+	# Incomplete escape sequence at the end of a chunk
+	__escape_prefix__ = re.compile('\x1b(?:\\[[0-?]*[ -/]*|[]PX^_][^\x07\x1b]*\x1b?|[ -/]*)\\Z')
+	# Style names, in the order used for building style strings
+	__styles__ = ['bold', 'faint', 'italic', 'underline', 'blink', 'blink2', 'negative', 'concealed', 'crossed']
+	__colors__ = ['black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white']
+
+	def __init__(self, encoding='utf-8'):
+		"""
+		:param encoding: encoding used for decoding bytes chunks
+		"""
+		self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+		self._pending = ''  # incomplete escape sequence from the previous chunk
+		self.reset()
+
+	def _style(self):
+		"""
+		Get the current style as a dictionary with 'fg', 'bg' and 'style' keys
+		"""
+		styles = [name for name in self.__styles__ if name in self._styles]
+		return {'fg': self._fg, 'bg': self._bg, 'style': '+'.join(styles) if len(styles) > 0 else None}
+
+	def _extended_color(self, codes, i):
+		"""
+		Parse an extended color (256 colors or true color) following a 38 or 48 code
+		:param codes: list of integer codes
+		:param i: index of the 38 or 48 code
+		:return: (color, index of the next code) tuple, color is None if the codes are invalid
+		"""
+		if i + 2 < len(codes) and codes[i+1] == 5:
+			return codes[i+2], i + 3
+		if i + 1 < len(codes) and codes[i+1] == 2 and i + 4 < len(codes):
+			return tuple(codes[i+2:i+5]), i + 5
+		return None, len(codes)
+
+	def _apply_sgr(self, params):
+		"""
+		Update the current style with the parameters of a SGR escape sequence
+		:param params: parameter string, e.g. '1;31'
+		"""
+		codes = [int(c) if c.isdigit() else 0 for c in params.replace(':', ';').split(';')]
+		i = 0
+		while i < len(codes):
+			code = codes[i]
+			i += 1
+			if code == 0:
+				self.reset()
+			elif 1 <= code <= 9:
+				self._styles.add(self.__styles__[code - 1])
+			elif code == 22:
+				self._styles.difference_update(['bold', 'faint'])
+			elif code == 25:
+				self._styles.difference_update(['blink', 'blink2'])
+			elif code in [23, 24, 27, 28, 29]:
+				self._styles.discard(self.__styles__[code - 21])
+			elif 30 <= code <= 37:
+				self._fg = self.__colors__[code - 30]
+			elif 40 <= code <= 47:
+				self._bg = self.__colors__[code - 40]
+			elif 90 <= code <= 97:
+				self._fg = code - 90 + 8
+			elif 100 <= code <= 107:
+				self._bg = code - 100 + 8
+			elif code == 39:
+				self._fg = None
+			elif code == 49:
+				self._bg = None
+			elif code in [38, 48]:
+				color, i = self._extended_color(codes, i - 1)
+				if color is not None and code == 38:
+					self._fg = color
+				elif color is not None:
+					self._bg = color
+
+	def feed(self, chunk, final=False):
+		"""
+		Parse a new chunk
+		:param chunk: string or bytes
+		:param final: True if this is the last chunk, incomplete escape sequences are then discarded
+		:return: RichText object with the text decoded from this chunk
+		"""
+		if isinstance(chunk, bytes):
+			chunk = self._decoder.decode(chunk, final)
+		text = self._pending + chunk
+		self._pending = ''
+		# Keep an incomplete escape sequence at the end of the chunk for the next call
+		tail = self.__escape_prefix__.search(text) if '\x1b' in text else None
+		if tail is not None:
+			text = text[:tail.start()]
+			if not final:
+				self._pending = tail.group(0)
+		# Walk the escape sequences once, collecting text runs with their style
+		runs = []
+		cursor = 0
+		style = self._style()
+		for match in self.__escape__.finditer(text):
+			runs.append((text[cursor:match.start()], style))
+			cursor = match.end()
+			if match.group(2) == 'm':
+				self._apply_sgr(match.group(1))
+				style = self._style()
+		runs.append((text[cursor:], style))
+		return RichText.__from_runs__(runs)
+
+	def reset(self):
+		"""
+		Reset the current style to default
+		:return: self
+		"""
+		self._fg = None
+		self._bg = None
+		self._styles = set()
+		return self
+
+
 class ConsolePrinter:
 
 	def __init__(self, line_length):
@@ -726,6 +1615,14 @@ class ConsolePrinter:
 			'failed': {'fg': None, 'bg': 'red'}
 		}
 		self._color_status = copy.deepcopy(self._color_status_default)
+		self._templates = {}  # cache of rendered line templates, see _template()
+		# Log-storm protection
+		self._coalesce = False  # if True, identical consecutive messages are printed only once
+		self._last_msg = None  # last printed message, as a (label, status, alinea, text) tuple
+		self._num_repeats = 0  # number of times the last printed message has been repeated since
+		self._rate_limits = {}  # label or status type -> (max number of messages, period in seconds)
+		self._rate_windows = {}  # label or status type -> [window start time, num printed, num suppressed]
+		self._suppressed = {'repeated': 0}  # suppression counters, by reason
 		if not isinstance(line_length, int):
 			raise TypeError('integer value expected for line length')
 		min_valid_line_length = 2 * (self._width_label + self._width_status)
@@ -746,48 +1643,179 @@ class ConsolePrinter:
 		which usually happens when the program terminates
 		:return:
 		"""
+		self.flush()
 		print(' ')
 
-	def _print_msg(self, msg, label=None, status=None):
+	def _format_msg(self, msg, label=None, status=None, alinea=None, prefix=''):
 		"""
-		Print the input message with optional label and status
+		Create the line displaying the input message with optional label and status
+		Only the message itself is formatted here, the rest of the line comes from a precompiled template
 		:param msg: string or RichText object with the text message that should be displayed
 		:param label: optional, should be 'info, 'warning' or 'error'
 		:param status: optional, should be 'ok' or 'failed'
+		:param alinea: optional alinea level, the current alinea level is used by default
+		:param prefix: optional string inserted between the label and the alinea
+		:return: string ready for display
+		"""
+		head, head_length, tail, raw_head = self._template(label, status, self._alinea if alinea is None else alinea, prefix)
+		msg = __stripped__(msg)
+		if tail is None:
+			return head + str(msg)
+		# If a status needs to be appended, cut the message shorter and pad it
+		width = self._length - self._width_status - 1 - head_length
+		msg_width = display_width(msg)
+		if msg_width > width:
+			if width < 3:
+				# No room left for the ellipsis after the head (narrow line, deep alinea), cut into the head as well
+				line = raw_head + msg
+				line = line[: __width_index__(line, self._length - self._width_status - 4)] + '...'
+				return str(line) + ' ' * (self._length - self._width_status - 1 - display_width(line)) + tail
+			msg = msg[: __width_index__(msg, width - 3)] + '...'
+			msg_width = display_width(msg)
+		return head + str(msg) + ' ' * (width - msg_width) + tail
+
+	def _template(self, label, status, alinea, prefix=''):
+		"""
+		Get the rendered constant parts of a line, compiled once for each combination of inputs
+		The cache is cleared whenever colors are modified
+		:param label: None or label type
+		:param status: None or status type
+		:param alinea: alinea level
+		:param prefix: string inserted between the label and the alinea
+		:return: (rendered head, head length, rendered tail, unrendered head) tuple, the tail is None if there is no status
+		"""
+		key = (label, status, alinea, prefix, self._length)
+		template = self._templates.get(key)
+		if template is None:
+			head = self._format_label(label) + ' ' + prefix + '  ' * alinea
+			tail = None if status is None else ' ' + str(self._format_status(status))
+			template = self._templates[key] = (str(head), display_width(head), tail, head)
+		return template
+
+	def _format_label(self, label):
+		"""
+		Create the label string for display
+		:param label: None or label type, should be 'info, 'warning' or 'error'
+		:return: string or RichText object with a length equal to the label width
 		"""
-		# Create label string for display
 		if label is None:
-			label_display = ' ' * self._width_label
-		else:
-			label = label.lower().strip()
-			self._validate_label(label)
-			fg = self._color_label[label]['fg']
-			bg = self._color_label[label]['bg']
-			label_display = '[' + label.upper().center(self._width_label - 2) + ']'
-			label_display = RichText(label_display, fg=fg, bg=bg, style='bold')
-		# Create status string for display
+			return ' ' * self._width_label
+		label = label.lower().strip()
+		self._validate_label(label)
+		fg = self._color_label[label]['fg']
+		bg = self._color_label[label]['bg']
+		label_display = '[' + label.upper().center(self._width_label - 2) + ']'
+		return RichText(label_display, fg=fg, bg=bg, style='bold')
+
+	def _format_status(self, status):
+		"""
+		Create the status string for display
+		:param status: None or status type, should be 'ok' or 'failed'
+		:return: string or RichText object, empty if status is None
+		"""
 		if status is None:
-			status_display = ''
+			return ''
+		status = status.lower().strip()
+		self._validate_status(status)
+		fg = self._color_status[status]['fg']
+		bg = self._color_status[status]['bg']
+		status_display = '[' + status.upper().center(self._width_status - 2) + ']'
+		return RichText(status_display, fg=fg, bg=bg, style='bold')
+
+	def _format_header(self, title):
+		"""
+		Create the header block displaying the input title
+		:param title: header title
+		:return: RichText object ready for display
+		"""
+		line1 = '*' * self._length
+		line2 = '*' * 10 + ' ' + __stripped__(title) + ' '
+		if display_width(line2) > self._length:
+			line2 = line2[: __width_index__(line2, self._length-3)] + '...'
 		else:
-			status = status.lower().strip()
-			self._validate_status(status)
-			fg = self._color_status[status]['fg']
-			bg = self._color_status[status]['bg']
-			status_display = '[' + status.upper().center(self._width_status - 2) + ']'
-			status_display = RichText(status_display, fg=fg, bg=bg, style='bold')
-		# Create the printed message
-		out = label_display + ' ' + self._create_alinea() + msg.strip()
-		# Append status
+			line2 = line2 + '*' * (self._length - display_width(line2))
+		return RichText('\n' + line1 + '\n' + line2 + '\n', style='bold')
+
+	def _is_rate_limited(self, kind):
+		"""
+		Check the rate limit of a label or status type and update its counters
+		:param kind: label or status type, may be None
+		:return: True if the message should be suppressed, False otherwise
+		"""
+		limit = self._rate_limits.get(kind)
+		if limit is None:
+			return False
+		max_messages, period = limit
+		now = time.monotonic()
+		window = self._rate_windows[kind]
+		if now - window[0] >= period:
+			# Start a new window, reporting messages suppressed during the previous one
+			if window[2] > 0:
+				self._print_notice('(' + format(window[2], ',') + ' ' + kind + ' messages suppressed)')
+			window[0:3] = [now, 0, 0]
+		if window[1] >= max_messages:
+			window[2] += 1
+			self._suppressed[kind] = self._suppressed.get(kind, 0) + 1
+			return True
+		window[1] += 1
+		return False
+
+	def _is_suppressed(self, msg, label=None, status=None):
+		"""
+		Decide whether a message should be suppressed, before any formatting is done
+		Identical consecutive messages are coalesced (if enabled), then label and status rate limits are applied
+		:param msg: string or RichText object with the text message that should be displayed
+		:param label: optional label type
+		:param status: optional status type
+		:return: True if the message should be suppressed, False otherwise
+		"""
+		label = label.lower().strip() if label is not None else None
+		status = status.lower().strip() if status is not None else None
+		# Validate inputs first, so that invalid labels and statuses raise even while being rate-limited
+		if label is not None:
+			self._validate_label(label)
 		if status is not None:
-			# If a status needs to be appended, cut the line shorter and add it
-			length = self._length - self._width_status - 1
-			if len(out) > length:
-				out = out[: length - 3] + '...'
-			out = out.ljust(length) + ' ' + status_display
-			# Do a quick check
-			if len(out) != self._length:
-				raise Warning('unexpected string length')
-		print(out)
+			self._validate_status(status)
+		key = None
+		if self._coalesce:
+			key = (label, status, self._alinea, msg.str() if isinstance(msg, RichText) else msg)
+			if key == self._last_msg:
+				self._num_repeats += 1
+				self._suppressed['repeated'] += 1
+				return True
+		if self._is_rate_limited(label) or self._is_rate_limited(status):
+			return True
+		# Rate-limited counts are only reported when their period ends or on flush(), not before every message
+		self._flush_repeats()
+		self._last_msg = key
+		return False
+
+	def _print_notice(self, text):
+		"""
+		Print a notice issued by the printer itself, without label nor status
+		:param text: notice text
+		"""
+		print(self._format_msg(text))
+
+	def _print_msg(self, msg, label=None, status=None):
+		"""
+		Print the input message with optional label and status
+		:param msg: string or RichText object with the text message that should be displayed
+		:param label: optional, should be 'info, 'warning' or 'error'
+		:param status: optional, should be 'ok' or 'failed'
+		"""
+		if self._is_suppressed(msg, label, status):
+			return
+		self._print_line(msg, label, status)
+
+	def _print_line(self, msg, label=None, status=None):
+		"""
+		Print a single line of a message, once it has been decided that the message is not suppressed
+		:param msg: string or RichText object with the text of the line
+		:param label: optional label type
+		:param status: optional status type
+		"""
+		print(self._format_msg(msg, label, status))
 
 	def _validate_label(self, label):
 		valid_values = list(self._color_label.keys())
@@ -833,22 +1861,29 @@ class ConsolePrinter:
 
 	def header(self, title):
 		# Print a header
-		line1 = '*' * self._length
-		line2 = '*' * 10 + ' ' + title.strip() + ' '
-		if len(line2) > self._length:
-			line2 = line2[: self._length-3] + '...'
-		else:
-			line2 = line2.ljust(self._length, '*')
-		print(RichText('\n' + line1 + '\n' + line2 + '\n', style='bold'))
+		self.flush()
+		print(self._format_header(title))
 
-	def print(self, msg, label=None, status=None):
+	def print(self, msg, label=None, status=None, wrap=False):
 		"""
 		Print any message
 		:param msg: message to print
 		:param label: optional label
 		:param status: optional status
-		"""
-		self._print_msg(msg, label, status)
+		:param wrap: if True, long messages are wrapped on several lines aligned with the current alinea
+		"""
+		if not wrap:
+			self._print_msg(msg, label, status)
+			return
+		# Suppression is decided once for the whole message, not line by line
+		if self._is_suppressed(msg, label, status):
+			return
+		width = self._length - self._width_label - 1 - len(self._create_alinea())
+		if status is not None:
+			width -= self._width_status + 1
+		lines = (msg if isinstance(msg, RichText) else RichText(msg)).wrap(max(1, width)) or [RichText('')]
+		for i, line in enumerate(lines):
+			self._print_line(line, label if i == 0 else None, status if i == len(lines) - 1 else None)
 
 	def info(self, msg):
 		"""
@@ -878,6 +1913,18 @@ class ConsolePrinter:
 		"""
 		self._print_msg(msg, status='failed')
 
+	def progress(self, msg, total=None, label='info', min_interval=0.1, min_delta=1.0):
+		"""
+		Create a progress line, redrawn in place below the last printed message
+		:param msg: message displayed in front of the progress bar
+		:param total: total number of items, None if unknown
+		:param label: optional label
+		:param min_interval: min time in seconds between two redraws
+		:param min_delta: min progress in percent between two redraws, only applies when total is known
+		:return: ProgressLine object
+		"""
+		return ProgressLine(self, msg, total=total, label=label, min_interval=min_interval, min_delta=min_delta)
+
 	def set_label_color(self, label_type, color):
 		"""
 		Set color for labels
@@ -887,6 +1934,7 @@ class ConsolePrinter:
 		"""
 		self._validate_label(label_type)
 		self._color_label[label_type] = color
+		self._templates = {}
 		return self
 
 	def set_status_color(self, status_type, color):
@@ -898,8 +1946,77 @@ class ConsolePrinter:
 		"""
 		self._validate_status(status_type)
 		self._color_status[status_type] = color
+		self._templates = {}
+		return self
+
+	def flush(self):
+		"""
+		Print the pending notices about the last message being repeated and about rate-limited messages, if any
+		Rate limits keep applying to the current periods, only their suppression counts are reset
+		:return: self
+		"""
+		self._flush_repeats()
+		for kind, window in self._rate_windows.items():
+			if window[2] > 0:
+				self._print_notice('(' + format(window[2], ',') + ' ' + kind + ' messages suppressed)')
+				window[2] = 0
+		return self
+
+	def _flush_repeats(self):
+		"""
+		Print the pending notice about the last message being repeated, if any
+		"""
+		if self._num_repeats > 0:
+			self._print_notice('(last message repeated ' + format(self._num_repeats, ',') + ' times)')
+			self._num_repeats = 0
+
+	def set_coalescing(self, flag=True):
+		"""
+		Enable or disable the coalescing of identical consecutive messages
+		When enabled, repeated messages are counted and replaced with a single 'last message repeated' notice
+		:param flag: True to enable coalescing, False to disable it
+		:return: self, modified
+		"""
+		if not flag:
+			self.flush()
+			self._last_msg = None
+		self._coalesce = bool(flag)
 		return self
 
+	def set_rate_limit(self, kind, max_messages, period=1.0):
+		"""
+		Limit the number of messages printed with a given label or status
+		Messages exceeding the limit are dropped, their number is reported when the next period starts or on flush()
+		:param kind: label or status type, should be one of the valid label or status types
+		:param max_messages: max number of messages printed per period, None to remove the limit
+		:param period: period in seconds
+		:return: self, modified
+		"""
+		if kind not in self._color_label and kind not in self._color_status:
+			raise ValueError('rate limits apply to label or status types: ' +
+							 ', '.join(list(self._color_label.keys()) + list(self._color_status.keys())))
+		if max_messages is None:
+			window = self._rate_windows.pop(kind, None)
+			if window is not None and window[2] > 0:
+				self._print_notice('(' + format(window[2], ',') + ' ' + kind + ' messages suppressed)')
+			self._rate_limits.pop(kind, None)
+			return self
+		if not isinstance(max_messages, int) or max_messages < 0:
+			raise ValueError('max number of messages should be a positive integer')
+		if period <= 0:
+			raise ValueError('period should be strictly positive')
+		self._rate_limits[kind] = (max_messages, period)
+		self._rate_windows[kind] = [time.monotonic(), 0, 0]
+		return self
+
+	def suppression_counters(self):
+		"""
+		Get the number of suppressed messages, for monitoring purposes
+		:return: dictionary with the number of coalesced messages under the 'repeated' key
+			and the number of rate-limited messages under label and status type keys
+		"""
+		return dict(self._suppressed)
+
 	def reset_colors(self):
 		"""
 		Reset label and status colors to default values
@@ -907,4 +2024,627 @@ class ConsolePrinter:
 		"""
 		self._color_label = copy.deepcopy(self._color_label_default)
 		self._color_status = copy.deepcopy(self._color_status_default)
+		self._templates = {}
 		return self
+
+
+def __nice_count__(count, width):
+	"""
+	Format a count so that it fits in the input width, using k/M/G suffixes for large counts
+	:param count: integer
+	:param width: max number of characters
+	:return: string
+	"""
+	out = str(count)
+	for divisor, suffix in [(1e3, 'k'), (1e6, 'M'), (1e9, 'G')]:
+		if len(out) <= width:
+			break
+		out = ('%.1f' % (count / divisor)).rstrip('0').rstrip('.') + suffix
+	return out
+
+
+def __render_runs__(runs):
+	"""
+	Render text runs with ANSI color and style codes in a single pass
+	Consecutive runs sharing the same style are merged before being rendered
+	:param runs: iterable of (text, style) tuples, style being None or a dictionary with 'fg', 'bg' and 'style' keys
+	:return: string with ANSI color and style codes
+	"""
+	out = []
+	texts = []
+	current = None
+	for text, style in runs:
+		if len(text) == 0:
+			continue
+		if style != current and len(texts) > 0:
+			joined = ''.join(texts)
+			out.append(colors.color(joined, **current) if current is not None and __flag_use_colors__ else joined)
+			texts = []
+		current = style
+		texts.append(text)
+	if len(texts) > 0:
+		joined = ''.join(texts)
+		out.append(colors.color(joined, **current) if current is not None and __flag_use_colors__ else joined)
+	return ''.join(out)
+
+
+class Table:
+	"""
+	Streaming table printer following the ConsolePrinter layout
+	Column widths are either fixed or estimated from the first rows, which are buffered until the estimation is done,
+	rows are then printed as they arrive:
+		with Table(['host', 'latency'], printer, sample=50) as table:
+			for host, latency in results:
+				table.add_row([host, latency])
+	Cells are rendered as style runs written in a single pass for each row, without RichText concatenations
+	"""
+
+	def __init__(self, columns, printer=None, widths=None, sample=20, align=None, styles=None, sep=' | ',
+				 header_style='bold', stream=None):
+		"""
+		:param columns: list of column headers
+		:param printer: optional ConsolePrinter object, the table is then aligned with messages and fits in its lines
+		:param widths: optional list of fixed column widths, None entries are estimated
+		:param sample: number of rows used for estimating column widths
+		:param align: optional list of column alignments, 'left' (default), 'right' or 'center'
+		:param styles: optional list of column styles, as dictionaries with 'fg', 'bg' and 'style' keys
+		:param sep: column separator
+		:param header_style: font style of the headers
+		:param stream: optional output stream, sys.stdout by default
+		"""
+		num_columns = len(columns)
+		if widths is not None and len(widths) != num_columns:
+			raise ValueError('one width per column is expected')
+		if align is not None and (len(align) != num_columns or any(a not in ['left', 'right', 'center'] for a in align)):
+			raise ValueError('one alignment per column is expected, should be \'left\', \'right\' or \'center\'')
+		if styles is not None and len(styles) != num_columns:
+			raise ValueError('one style per column is expected')
+		if not isinstance(sample, int) or sample < 0:
+			raise ValueError('sample size should be a positive integer')
+		self._columns = [str(c) for c in columns]
+		self._widths = list(widths) if widths is not None else [None] * num_columns
+		self._sample = sample
+		self._align = list(align) if align is not None else ['left'] * num_columns
+		self._styles = [None if st is None else {'fg': st.get('fg'), 'bg': st.get('bg'), 'style': st.get('style')}
+						for st in (styles if styles is not None else [None] * num_columns)]
+		self._sep = sep
+		self._header_style = {'fg': None, 'bg': None, 'style': header_style} if header_style is not None else None
+		self._stream = stream
+		self._prefix = ''
+		self._max_width = None
+		if printer is not None:
+			self._prefix = ' ' * (printer._width_label + 1) + printer._create_alinea()
+			self._max_width = printer._length - len(self._prefix)
+		self._buffer = []  # rows waiting for column widths to be estimated
+		self._is_laid_out = False
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+	def _layout(self):
+		"""
+		Estimate missing column widths from the headers and buffered rows, then shrink the widest columns
+		until the table fits in the max width
+		"""
+		cells = [[self._cell_text(row[i]) for row in self._buffer] for i in range(len(self._columns))]
+		for i in range(len(self._columns)):
+			if self._widths[i] is None:
+				self._widths[i] = max([display_width(self._columns[i])] + [display_width(c) for c in cells[i]])
+		if self._max_width is not None:
+			excess = sum(self._widths) + len(self._sep) * (len(self._widths) - 1) - self._max_width
+			while excess > 0 and max(self._widths) > 4:
+				self._widths[self._widths.index(max(self._widths))] -= 1
+				excess -= 1
+		self._is_laid_out = True
+
+	def _cell_text(self, value):
+		"""
+		Convert a cell value to a string or RichText object
+		"""
+		if value is None:
+			return ''
+		return value if isinstance(value, (str, RichText)) else str(value)
+
+	def _cell_runs(self, value, width, align, style):
+		"""
+		Create the style runs of a cell, truncated or padded to the column width
+		:return: list of (text, style) tuples
+		"""
+		value = self._cell_text(value)
+		value_width = display_width(value)
+		if value_width > width:
+			# The ellipsis is shortened in columns narrower than 3 characters
+			value = value[: __width_index__(value, max(0, width - 3))] + '.' * min(3, width)
+			value_width = display_width(value)
+		if isinstance(value, RichText):
+			runs = [(value.str()[sb.start:sb.start+sb.length], sb.__style__) for sb in value.__sbox__]
+		else:
+			runs = [(value, style)]
+		padding = width - value_width
+		left = 0 if align == 'left' else padding if align == 'right' else padding // 2
+		return [(' ' * left, None)] + runs + [(' ' * (padding - left), None)]
+
+	def _render_row(self, row, style=None):
+		"""
+		Render a row as a single string
+		:param row: list of cell values
+		:param style: optional style applied to all cells, overriding column styles
+		:return: rendered string
+		"""
+		if len(row) != len(self._columns):
+			raise ValueError('expected ' + str(len(self._columns)) + ' cells, got ' + str(len(row)))
+		runs = [(self._prefix, None)]
+		for i in range(len(row)):
+			if i > 0:
+				runs.append((self._sep, None))
+			runs += self._cell_runs(row[i], self._widths[i], self._align[i], self._styles[i] if style is None else style)
+		return __render_runs__(runs).rstrip(' ')
+
+	def _write(self, lines):
+		"""
+		Write several lines at once
+		"""
+		if len(lines) > 0:
+			stream = sys.stdout if self._stream is None else self._stream
+			stream.write('\n'.join(lines) + '\n')
+			stream.flush()
+
+	def _write_buffer(self):
+		"""
+		Estimate column widths, then write the headers and buffered rows
+		"""
+		self._layout()
+		rule = self._prefix + self._sep.replace(' ', '-').replace('|', '+').join('-' * w for w in self._widths)
+		lines = [self._render_row(self._columns, self._header_style), rule]
+		lines += [self._render_row(row) for row in self._buffer]
+		self._buffer = []
+		self._write(lines)
+
+	def add_row(self, row):
+		"""
+		Add a row, printed immediately once column widths are known
+		:param row: list of cell values (strings, RichText objects or any object convertible to a string)
+		:return: self
+		"""
+		if self._is_laid_out:
+			self._write([self._render_row(row)])
+			return self
+		self._buffer.append(row)
+		if len(self._buffer) >= self._sample or all(w is not None for w in self._widths):
+			self._write_buffer()
+		return self
+
+	def add_rows(self, rows):
+		"""
+		Add several rows, rows printed at once are written in a single batch
+		:param rows: iterable of rows
+		:return: self
+		"""
+		batch = []
+		for row in rows:
+			if self._is_laid_out:
+				batch.append(self._render_row(row))
+			else:
+				self.add_row(row)
+		self._write(batch)
+		return self
+
+	def close(self):
+		"""
+		Print the headers and buffered rows if column widths have not been estimated yet
+		:return: self
+		"""
+		if not self._is_laid_out:
+			self._write_buffer()
+		return self
+
+
+class ProgressLine:
+	"""
+	Progress bar or status line following the ConsolePrinter layout:
+		[  INFO  ] message [=============                 ] [ 42%  ]
+	The line is redrawn in place with a carriage return
+	Redraws are throttled by time and by progress delta: most update() calls only increment a counter
+	"""
+
+	# Max number of items between two time checks when the total is unknown, bounding the redraw delay
+	# when the update rate drops (e.g. 1.6 s at 20 items/s) for the cost of a clock read every 32 items
+	__max_step__ = 32
+
+	def __init__(self, printer, msg, total=None, label='info', min_interval=0.1, min_delta=1.0, stream=None):
+		"""
+		:param printer: ConsolePrinter object defining line length, field widths and colors
+		:param msg: message displayed in front of the progress bar
+		:param total: total number of items, None if unknown
+		:param label: optional label
+		:param min_interval: min time in seconds between two redraws
+		:param min_delta: min progress in percent between two redraws, only applies when total is known
+		:param stream: optional output stream, sys.stdout by default
+		"""
+		if total is not None and (not isinstance(total, int) or total <= 0):
+			raise ValueError('total should be None or a strictly positive integer')
+		self._printer = printer
+		self._msg = __stripped__(msg)
+		self._total = total
+		self._min_interval = min_interval
+		self._stream = stream
+		# The label and alinea prefix never changes, render it once
+		prefix = printer._format_label(label) + ' ' + printer._create_alinea()
+		self._prefix = str(prefix)
+		self._prefix_length = display_width(prefix)
+		# Throttling: the line is only considered for a redraw when the count reaches _next_count
+		# With a known total, _step is the number of items matching the min progress delta
+		# Otherwise it starts from 1 after each redraw and doubles while checks come too early, up to __max_step__
+		self._step = max(1, int(total * min_delta / 100.0)) if total is not None else 1
+		self._count = 0
+		self._next_count = 0
+		self._last_draw = -float('inf')
+		self._is_finished = False
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if not self._is_finished:
+			self.finish('ok' if exc_type is None else 'failed')
+		return False
+
+	def _render(self, status_display):
+		"""
+		Render the line
+		:param status_display: string or RichText object displayed in the status field
+		:return: rendered string
+		"""
+		length = self._printer._length - self._printer._width_status - 1 - self._prefix_length
+		msg = self._msg
+		if self._total is not None:
+			# Keep at least 10 characters for the progress bar
+			msg_length = max(0, length - 10 - 3)
+			if display_width(msg) > msg_length:
+				msg = msg[: __width_index__(msg, max(0, msg_length - 3))] + '...'
+			bar_width = length - display_width(msg) - 3
+			filled = int(bar_width * min(self._count, self._total) / self._total)
+			msg += ' [' + '=' * filled + ' ' * (bar_width - filled) + ']'
+		elif display_width(msg) > length:
+			msg = msg[: __width_index__(msg, length - 3)] + '...'
+		return self._prefix + str(msg) + ' ' * (length - display_width(msg)) + ' ' + str(status_display)
+
+	def _progress_display(self):
+		"""
+		Create the status field content: percentage with a known total, count otherwise
+		"""
+		width = self._printer._width_status - 2
+		if self._total is not None:
+			text = str(int(100 * min(self._count, self._total) / self._total)) + '%'
+		else:
+			text = __nice_count__(self._count, width)
+		return '[' + text.center(width) + ']'
+
+	def _draw(self, now):
+		"""
+		Redraw the line and schedule the next redraw
+		:param now: current time
+		"""
+		if self._total is None:
+			# Restart from a single item, so that a step grown during a fast phase can't delay redraws
+			# for long once the update rate drops
+			self._step = 1
+		self._last_draw = now
+		self._next_count = self._count + self._step
+		stream = sys.stdout if self._stream is None else self._stream
+		stream.write('\r' + self._render(self._progress_display()))
+		stream.flush()
+
+	def finish(self, status='ok'):
+		"""
+		Draw the final line with a status and move to the next line
+		:param status: final status, should be one of the printer's valid status types, None to keep the progress
+		:return: self
+		"""
+		self._is_finished = True
+		status_display = self._progress_display() if status is None else self._printer._format_status(status)
+		stream = sys.stdout if self._stream is None else self._stream
+		stream.write('\r' + self._render(status_display) + '\n')
+		stream.flush()
+		return self
+
+	def set_message(self, msg):
+		"""
+		Change the message displayed in front of the progress bar, the line is redrawn immediately
+		:param msg: new message
+		:return: self
+		"""
+		self._msg = __stripped__(msg)
+		self._draw(time.monotonic())
+		return self
+
+	def update(self, num=1):
+		"""
+		Increase the count of processed items, the line is redrawn only if throttling thresholds are reached
+		:param num: number of processed items
+		:return: self
+		"""
+		self._count += num
+		if self._count < self._next_count:
+			return self
+		now = time.monotonic()
+		if now - self._last_draw < self._min_interval:
+			# Too early: postpone the next check
+			if self._total is None:
+				self._step = min(2 * self._step, self.__max_step__)
+			self._next_count = self._count + self._step
+			return self
+		self._draw(now)
+		return self
+
+
+# Label used in message records to identify headers
+__header_label__ = '__header__'
+
+
+class QueuePrinter(ConsolePrinter):
+	"""
+	ConsolePrinter for worker processes
+	Messages are not formatted nor printed by the worker: they are sent as compact records to a single ConsoleWriter
+	Records are tuples (label, status, message, alinea, timestamp, pid)
+	"""
+
+	def __init__(self, queue, line_length=80):
+		"""
+		:param queue: multiprocessing queue (or any object with a put() method) read by the writer
+		:param line_length: line length, only used for validating inputs
+		"""
+		super(QueuePrinter, self).__init__(line_length)
+		self._queue = queue
+
+	def __del__(self):
+		"""
+		The writer is in charge of the console, only pending notices are sent when a worker printer is deleted
+		"""
+		try:
+			self.flush()
+		except Exception:
+			# The queue may already be closed at interpreter shutdown
+			pass
+
+	def _send(self, label, status, msg):
+		"""
+		Send a message record to the writer
+		"""
+		self._queue.put((label, status, msg, self._alinea, time.time(), os.getpid()))
+
+	def _print_notice(self, text):
+		"""
+		Send a notice issued by the printer itself to the writer
+		:param text: notice text
+		"""
+		self._send(None, None, text)
+
+	def _print_line(self, msg, label=None, status=None):
+		"""
+		Send a single line of a message with optional label and status to the writer
+		Label and status have already been validated by _is_suppressed(), so that errors are raised in the worker
+		and not in the writer
+		:param msg: string or RichText object with the text of the line
+		:param label: optional label type
+		:param status: optional status type
+		"""
+		label = label.lower().strip() if label is not None else None
+		status = status.lower().strip() if status is not None else None
+		self._send(label, status, msg)
+
+	def header(self, title):
+		# Send a header
+		self.flush()
+		self._send(__header_label__, None, title)
+
+
+class ConsoleWriter:
+	"""
+	Single writer for messages sent by QueuePrinter objects from several processes
+	Records are read from a multiprocessing queue, formatted by a ConsolePrinter and written in batches
+	Since records may arrive out of order, they are held for a small time window and sorted by timestamp
+	Typical usage:
+		writer = ConsoleWriter(ConsolePrinter(80)).start()
+		workers = [multiprocessing.Process(target=job, args=(writer.printer(),)) for _ in range(4)]
+		...
+		writer.stop()
+	"""
+
+	def __init__(self, printer, queue=None, batch_size=64, window=0.05, show_pid=False, stream=None):
+		"""
+		:param printer: ConsolePrinter object used for formatting messages
+		:param queue: optional queue from which records are read, a new multiprocessing queue by default
+		:param batch_size: max number of records read from the queue before writing
+		:param window: reordering time window in seconds, records are written once they are older than this window
+		:param show_pid: if True, messages are prefixed with the pid of the worker process
+		:param stream: optional output stream, sys.stdout by default
+		"""
+		if not isinstance(batch_size, int) or batch_size < 1:
+			raise ValueError('batch size should be a strictly positive integer')
+		if window < 0:
+			raise ValueError('reordering window should be positive')
+		self._printer = printer
+		self._queue = multiprocessing.Queue() if queue is None else queue
+		self._batch_size = batch_size
+		self._window = window
+		self._show_pid = show_pid
+		self._stream = stream
+		self._pending = []  # heap of (timestamp, sequence number, record) tuples
+		self._sequence = 0  # sequence number, preserves the reception order of records with the same timestamp
+		self._thread = None
+
+	def _format_record(self, record):
+		"""
+		Format a single message record
+		:param record: (label, status, message, alinea, timestamp, pid) tuple
+		:return: formatted string
+		"""
+		label, status, msg, alinea, _, pid = record
+		if label == __header_label__:
+			return str(self._printer._format_header(msg))
+		prefix = '[' + str(pid) + '] ' if self._show_pid else ''
+		return str(self._printer._format_msg(msg, label, status, alinea=alinea, prefix=prefix))
+
+	def _receive(self):
+		"""
+		Read a batch of records from the queue
+		Waits for the first record at most the duration of the reordering window
+		:return: list of records, None is used as an end marker
+		"""
+		try:
+			records = [self._queue.get(timeout=max(self._window, 0.01))]
+		except Empty:
+			return []
+		while len(records) < self._batch_size and records[-1] is not None:
+			try:
+				records.append(self._queue.get_nowait())
+			except Empty:
+				break
+		return records
+
+	def flush(self, before=None):
+		"""
+		Write pending records in timestamp order
+		:param before: only records with a timestamp lower or equal to this value are written, all by default
+		:return: self
+		"""
+		lines = []
+		while len(self._pending) > 0 and (before is None or self._pending[0][0] <= before):
+			lines.append(self._format_record(heapq.heappop(self._pending)[2]))
+		if len(lines) > 0:
+			stream = sys.stdout if self._stream is None else self._stream
+			stream.write('\n'.join(lines) + '\n')
+			stream.flush()
+		return self
+
+	def printer(self):
+		"""
+		Create a printer to be used by a worker process
+		:return: QueuePrinter object sending records to this writer
+		"""
+		return QueuePrinter(self._queue, self._printer._length)
+
+	def queue(self):
+		"""
+		Getter for the queue from which records are read
+		"""
+		return self._queue
+
+	def run(self):
+		"""
+		Read, format and write records until the end marker is received
+		This is the writer loop, it may be called directly in any process or run in a thread with start()
+		"""
+		is_finished = False
+		while not is_finished:
+			for record in self._receive():
+				if record is None:
+					is_finished = True
+				else:
+					heapq.heappush(self._pending, (record[4], self._sequence, record))
+					self._sequence += 1
+			self.flush(None if is_finished else time.time() - self._window)
+
+	def start(self):
+		"""
+		Run the writer loop in a background thread
+		:return: self
+		"""
+		self._thread = threading.Thread(target=self.run, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		"""
+		Send the end marker, then wait for all remaining records to be written
+		:return: self
+		"""
+		self._queue.put(None)
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+		return self
+
+
+class ConsolePrinterFormatter(logging.Formatter):
+	"""
+	Logging formatter producing the same lines as a ConsolePrinter
+	Line templates (label, alinea and status) are precompiled and cached by the printer,
+	so that only the message part is formatted for each record
+	Alinea and status may be set for a single record with the 'extra' argument of logging calls:
+		logger.info('Computation done', extra={'alinea': 1, 'status': 'ok'})
+	"""
+
+	def __init__(self, printer):
+		"""
+		:param printer: ConsolePrinter object defining line length, field widths and colors
+		"""
+		super(ConsolePrinterFormatter, self).__init__()
+		self._printer = printer
+
+	def _label(self, levelno):
+		"""
+		Get the ConsolePrinter label matching a logging level
+		:param levelno: logging level number
+		:return: label type
+		"""
+		if levelno >= logging.ERROR:
+			return 'error'
+		if levelno >= logging.WARNING:
+			return 'warning'
+		return 'info'
+
+	def format(self, record):
+		"""
+		Format a log record
+		:param record: logging.LogRecord object
+		:return: formatted string
+		"""
+		record.message = record.getMessage()
+		msg = record.message
+		if record.exc_info and not record.exc_text:
+			record.exc_text = self.formatException(record.exc_info)
+		if record.exc_text:
+			msg += '\n' + record.exc_text
+		if record.stack_info:
+			msg += '\n' + self.formatStack(record.stack_info)
+		alinea = getattr(record, 'alinea', self._printer._alinea)
+		status = getattr(record, 'status', None)
+		status = status.lower().strip() if status is not None else None
+		return self._printer._format_msg(msg, self._label(record.levelno), status, alinea=alinea)
+
+
+class ConsolePrinterHandler(logging.StreamHandler):
+	"""
+	Logging handler writing records formatted as ConsolePrinter lines
+	Formatting may be moved off the logging threads by attaching a QueueHandler to loggers
+	and serving this handler with a QueueListener:
+		queue = multiprocessing.Queue()  # or queue.Queue()
+		logger.addHandler(logging.handlers.QueueHandler(queue))
+		listener = ConsolePrinterHandler(ConsolePrinter(80)).listen(queue)
+		...
+		listener.stop()
+	"""
+
+	def __init__(self, printer, stream=None):
+		"""
+		:param printer: ConsolePrinter object defining line length, field widths and colors
+		:param stream: optional output stream, sys.stdout by default
+		"""
+		super(ConsolePrinterHandler, self).__init__(sys.stdout if stream is None else stream)
+		self.setFormatter(ConsolePrinterFormatter(printer))
+
+	def listen(self, queue):
+		"""
+		Start a QueueListener serving this handler
+		:param queue: queue to which a QueueHandler sends log records
+		:return: started logging.handlers.QueueListener object
+		"""
+		listener = logging.handlers.QueueListener(queue, self, respect_handler_level=True)
+		listener.start()
+		return listener
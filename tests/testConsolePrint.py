@@ -19,3 +19,140 @@ p.success('This is a success message with an alinea')
 p.alinea_decr()
 p.success('Same without alinea')
 p.failure('This is a failure message')
+p.alinea_incr()
+p.print('This is a long information message which is wrapped on several lines, ' +
+        'each of them being aligned with the current alinea level', label='info', wrap=True)
+p.print('This is a long success message which is wrapped on several lines, ' +
+        'the status being displayed on the last one', status='ok', wrap=True)
+p.alinea_decr()
+p.success('\u5bbd\u5b57\u7b26\u4e5f\u5bf9\u9f50\u4e86 (wide characters are aligned too)')
+p.failure('\u5bbd\u5b57\u7b26\u4e5f\u5bf9\u9f50\u4e86' * 5)
+
+# Frozen RichText objects can be printed, they are not stripped in place
+from consoleprint import RichText
+frozen = RichText('  This frozen message is printed as is  ', fg='cyan').freeze()
+p.info(frozen)
+p.success(frozen)
+
+# Deep alinea levels on a narrow line are truncated instead of raising
+narrow = ConsolePrinter(36)
+for i in range(9):
+    narrow.alinea_incr()
+narrow.success('x')
+narrow.alinea_decr().alinea_decr()
+narrow.failure('Short')
+
+# Log-storm protection
+p.set_coalescing(True)
+for i in range(12483):
+    p.error('This error message is repeated')
+p.info('Identical consecutive messages are coalesced')
+p.set_rate_limit('warning', 3, period=60)
+for i in range(10):
+    p.print('Warning number ' + str(i), label='warning')
+print(p.suppression_counters())
+p.set_rate_limit('warning', None).set_coalescing(False)
+p.set_rate_limit('error', 2, period=60)
+for i in range(5):
+    p.error('Error number ' + str(i))
+    p.info('Other messages do not report suppressed errors ' + str(i))
+p.flush()  # prints the pending '(3 error messages suppressed)' notice
+try:
+    p.print('Invalid statuses raise even while rate-limited', label='error', status='okay')
+except ValueError as e:
+    print('ValueError:', e)
+p.set_rate_limit('error', None)
+p.set_rate_limit('ok', 1, period=60).set_coalescing(True)
+for i in range(3):
+    # Wrapped messages are suppressed or coalesced as a whole
+    p.print('This wrapped message is only printed once, with all of its lines ' * 2, status='ok', wrap=True)
+p.flush().set_rate_limit('ok', None).set_coalescing(False)
+
+# Line templates are recompiled when colors change
+p.set_label_color('info', {'fg': 'magenta', 'bg': None})
+p.info('This is a magenta information message')
+p.reset_colors()
+p.info('Back to the default colors')
+
+# Several worker processes printing through a single writer
+import multiprocessing
+from consoleprint import ConsoleWriter
+
+
+def job(printer, index):
+    printer.info('Worker ' + str(index) + ' started')
+    printer.alinea_incr()
+    printer.success('Worker ' + str(index) + ' computation')
+    printer.alinea_decr()
+    printer.failure('Worker ' + str(index) + ' teardown')
+
+
+if __name__ == '__main__':
+    writer = ConsoleWriter(ConsolePrinter(60), show_pid=True).start()
+    writer.printer().header('MULTIPROCESSING')
+    workers = [multiprocessing.Process(target=job, args=(writer.printer(), i)) for i in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    writer.stop()
+
+# Standard logging calls formatted as ConsolePrinter lines, off the logging thread
+import logging
+import logging.handlers
+import queue
+from consoleprint import ConsolePrinterHandler
+
+if __name__ == '__main__':
+    log_queue = queue.Queue()
+    logger = logging.getLogger('testConsolePrint')
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = ConsolePrinterHandler(ConsolePrinter(60)).listen(log_queue)
+    logger.info('This is a %s message', 'logging')
+    logger.warning('This is a warning message', extra={'alinea': 1})
+    logger.error('This is an error message', extra={'alinea': 1, 'status': 'failed'})
+    logger.info('This is a logging message that is way too long for the selected output length',
+                extra={'status': 'ok'})
+    listener.stop()
+
+# Progress lines
+if __name__ == '__main__':
+    p = ConsolePrinter(60)
+    with p.progress('Processing items', total=1000000) as progress:
+        for i in range(1000000):
+            progress.update()
+    with p.progress('Processing a stream of unknown length') as progress:
+        for i in range(300000):
+            progress.update()
+    p.progress('Processing items that fail', total=10, label=None).update(3).finish('failed')
+    # The line keeps being redrawn when the update rate drops after a fast phase
+    import io
+    import time
+    from consoleprint import ProgressLine
+    out = io.StringIO()
+    progress = ProgressLine(p, 'Fast then slow stream', stream=out)
+    for i in range(2000000):
+        progress.update()
+    num_redraws = out.getvalue().count('\r')
+    for i in range(30):
+        time.sleep(0.05)
+        progress.update()
+    print('Redraws during the slow phase:', out.getvalue().count('\r') - num_redraws > 0)
+
+# Streaming tables
+if __name__ == '__main__':
+    from consoleprint import RichText, Table
+    p = ConsolePrinter(60)
+    p.info('Latency by host')
+    p.alinea_incr()
+    with Table(['host', 'status', 'latency (ms)'], p, sample=3, align=['left', 'center', 'right'],
+               styles=[{'style': 'bold'}, None, {'fg': 'cyan'}]) as table:
+        table.add_row(['alpha.example.com', RichText('up', fg='green'), 12.5])
+        table.add_row(['beta', RichText('down', fg='red'), None])
+        table.add_rows([['host-' + str(i), RichText('up', fg='green'), i * 1.5] for i in range(3)])
+        table.add_row(['a-host-name-that-is-longer-than-the-estimated-width', RichText('up', fg='green'), 3])
+    with Table(['fixed', 'widths'], widths=[6, 10]) as table:
+        table.add_row(['abcdefghij', 'abcdefghij'])
+    with Table(['narrow', 'columns', 'x'], widths=[2, 1, 0]) as table:
+        table.add_row(['abcdefghij', 'abcdefghij', 'abc'])
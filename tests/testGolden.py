@@ -0,0 +1,335 @@
+"""
+Golden-output and performance regression tests
+Every case of the corpus renders charts or RichText objects, its output is compared byte by byte with a golden
+file of the 'golden' directory
+Durations are optionally checked too: they are recorded relative to the duration of a calibration loop, so that
+references measured on one machine still apply on a faster or slower one
+Fast paths are also compared with the straightforward way of computing the same result
+
+Usage: python testGolden.py [--update] [--timing] [--tolerance FACTOR]
+    --update     regenerate the golden files and the reference durations
+    --timing     check durations against the references, skipped by default
+                 (also enabled by setting the CONSOLEPRINT_PERF_TIMING environment variable to 1)
+    --tolerance  max ratio between measured and reference durations, 3 by default
+                 (also settable with the CONSOLEPRINT_PERF_TOLERANCE environment variable)
+"""
+import contextlib
+import copy
+import io
+import json
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from consoleprint import ConsolePrinter, RichText, decode_texts, display_width, encode_texts
+from Histogram import *
+
+golden_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+timings_file = os.path.join(golden_dir, 'timings.json')
+update = '--update' in sys.argv
+timing = '--timing' in sys.argv or os.environ.get('CONSOLEPRINT_PERF_TIMING') == '1'
+tolerance = float(os.environ.get('CONSOLEPRINT_PERF_TOLERANCE', 3.0))
+if '--tolerance' in sys.argv:
+    tolerance = float(sys.argv[sys.argv.index('--tolerance') + 1])
+# Durations below this threshold (in seconds) are too noisy to be compared
+min_duration = 0.005
+
+
+def capture(fun):
+    """
+    Run a function and return everything it prints
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        fun()
+    return out.getvalue()
+
+
+def best_duration(fun, repeat=3):
+    """
+    Run a function several times, return its last result and its shortest duration in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fun()
+        durations.append(time.perf_counter() - start)
+    return result, min(durations)
+
+
+def calibration_loop():
+    """
+    Fixed amount of pure Python work, durations of the corpus are measured in units of its duration
+    """
+    total = 0
+    for i in range(300000):
+        total += i * i % 7
+    return total
+
+
+def stacked_data(seed, num_values):
+    """
+    Random list of dictionaries for stacked bar charts
+    """
+    rng = random.Random(seed)
+    names = ['Agos', 'Sofinco', 'Creditplus', 'CACF NL', 'Credibom', 'Wafasalaf', 'GAC', 'CACF Bankia']
+    probabilities = [0.7, 0.3, 0.5, 0.1, 0.8, 0.2, 0.7, 0.9]
+    data = []
+    for _ in range(num_values):
+        values = {}
+        while len(values) == 0:
+            for j in range(len(names)):
+                if rng.random() <= probabilities[j]:
+                    values[names[j]] = rng.randint(1, 1000000)
+        data.append(values)
+    return data
+
+
+def integers(seed, num_values, low, high):
+    rng = random.Random(seed)
+    return [rng.randint(low, high) for _ in range(num_values)]
+
+
+# Corpus of renderings, each case returns the text to compare with its golden file
+corpus = {}
+colorfun = lambda index, y: 'red' if y <= 50 else 'yellow' if y <= 70 else 'green'
+letters = [chr(ord('A') + i) for i in range(26)]
+
+corpus['bars_plain'] = lambda: capture(lambda: Bars(height=20).plot(integers(1, 12, 0, 1000)))
+corpus['bars_showvalues'] = lambda: capture(lambda: Bars(height=20, showvalues=True, spacing=1, thickness=7).plot(
+    integers(2, 24, 0, 1000), labels=letters[:24], ticks='auto'))
+corpus['bars_wrapped_labels'] = lambda: capture(lambda: Bars(height=20, showvalues=True, spacing=3, thickness=9).plot(
+    integers(3, 20, 0, 1000), labels=['I am in segment ' + x for x in letters[:20]]))
+corpus['bars_colorfun_ticks_all'] = lambda: capture(lambda: Bars(
+    height=12, color=colorfun, spacing=1, thickness=3, showvalues=True, ymax=120).plot(
+    integers(4, 25, 0, 100), ticks='all'))
+corpus['bars_no_ticks_title'] = lambda: capture(lambda: Bars(height=10, color=colorfun, ymax=100).plot(
+    integers(5, 15, 0, 100), ticks=None, title=RichText('Custom', fg='red') + RichText(' title', style='bold')))
+corpus['bars_subcells'] = lambda: capture(lambda: Bars(height=8, showvalues=True, spacing=1, thickness=3,
+                                                       subcells=True).plot(
+    [0, 1, 3, 5, 7, 8, 11, 13, 16, 20, 24, 31, 32], labels=letters[:13]))
+corpus['bars_large'] = lambda: capture(lambda: Bars(height=40, showvalues=True, spacing=1, thickness=3).plot(
+    integers(6, 300, 0, 999)))
+for pos in ['right', 'top', 'bottom']:
+    corpus['stacked_' + pos] = (lambda p: lambda: capture(lambda: StackedBars(20, spacing=1, thickness=3).plot(
+        stacked_data(7, 28), legendpos=p, title='Stacked bars with legend ' + p)))(pos)
+    corpus['percentage_' + pos] = (lambda p: lambda: capture(lambda: PercentageStackedBars(
+        height=20, spacing=1, thickness=3).plot(stacked_data(8, 28), legendpos=p, title='Percentage ' + p)))(pos)
+corpus['stacked_numticks'] = lambda: capture(lambda: StackedBars(height=20).plot(
+    [{'A': 5, 'B': 12}, {'A': 7, 'C': 15}, {'B': 36}, {'C': 4, 'D': 87}], legendpos='top', numticks=10))
+corpus['negative_bars'] = lambda: capture(lambda: PositiveNegativeBars(height=15, ymax=5, ymin=-10).plot(
+    list(range(-10, 6)), ticks='all'))
+corpus['negative_bars_random'] = lambda: capture(lambda: PositiveNegativeBars(height=20, spacing=1, thickness=3).plot(
+    integers(9, 40, -500, 800)))
+corpus['negative_bars_subcells'] = lambda: capture(lambda: PositiveNegativeBars(
+    height=10, ymax=5, ymin=-5, subcells=True).plot([x / 2 for x in range(-10, 11)], ticks='all'))
+corpus['scrolling_bars'] = lambda: capture(lambda: ScrollingBars(capacity=50, height=10, color=colorfun).extend(
+    integers(10, 500, 0, 100)).plot(title='Scrolling bars'))
+if np is not None:
+    corpus['line'] = lambda: capture(lambda: Line(width=60, height=12).plot(
+        [np.sin(np.linspace(0, 12, 200)), np.cos(np.linspace(0, 12, 200))], x=np.linspace(0, 12, 200),
+        legend=['sin', 'cos'], legendpos='top'))
+    corpus['line_large'] = lambda: capture(lambda: Line(width=100, height=25).plot(
+        np.cumsum(np.random.default_rng(11).normal(size=1000000)), title='Random walk'))
+    corpus['scatter'] = lambda: capture(lambda: Scatter(width=40, height=10).plot(
+        np.random.default_rng(12).normal(size=(2, 2000)), legend=['a', 'b'], legendpos='bottom'))
+    corpus['heatmap'] = lambda: capture(lambda: Heatmap(width=60, height=15).plot(
+        np.sin(np.outer(np.linspace(0, 6, 120), np.linspace(0, 9, 300))), title='Heatmap'))
+    corpus['heatmap_large'] = lambda: capture(lambda: Heatmap(palette='truecolor').plot(
+        np.random.default_rng(13).normal(size=(2000, 2000)), legendpos='bottom'))
+
+
+def richtext_ops():
+    """
+    Most RichText operations, applied to a text long enough for being timed
+    """
+    rng = random.Random(14)
+    words = [RichText(''.join(rng.choice('abcdefgh') for _ in range(rng.randint(1, 9))),
+                      fg=rng.choice(['red', 'green', 'blue', None]), style=rng.choice([None, 'bold', 'underline']))
+             for _ in range(3000)]
+    text = RichText(' ').join(words)
+    out = [text[10:200], text[-100:], text[7]]
+    out += text.split(' ', 50)[:20]
+    out.append(copy.deepcopy(text[:400]).replace('a', 'AA'))
+    out.append(copy.deepcopy(text[:400]).upper())
+    out.append(copy.deepcopy(text[:80]).center(120, fillchar='*', fg='blue'))
+    out.append(copy.deepcopy(text[:80]).rjust(100, fillchar='.'))
+    out += text[:2000].wrap(60, indent='> ', subsequent_indent=RichText('| ', fg='cyan'))
+    out.append(RichText('\tab\tc', fg='red').join([text[:50], RichText('x\ty'), 'z\t']).expandtabs(4))
+    out.append(copy.deepcopy(text[:1000]).highlight('[abc]+', fg='magenta', style='bold'))
+    out.append(copy.deepcopy(text[:1000]).highlight_many([('de', {'bg': 'red'}), ('gh', {'fg': 214})]))
+    out.append(copy.deepcopy(text[:1000]).stylize_ranges([(i, i + 5, {'bg': 'blue'}) for i in range(0, 1000, 13)]))
+    out.append(RichText.from_ansi(str(text[:1000])))
+    return '\n'.join(str(x) for x in out) + '\n'
+
+
+corpus['richtext_ops'] = richtext_ops
+
+
+def printer_messages():
+    """
+    ConsolePrinter messages with labels, statuses, alineas and wrapped text
+    """
+    p = ConsolePrinter(80)
+    p.header('Golden output')
+    p.info('This is an information message')
+    p.alinea_incr()
+    p.error('This is an error message with ' + RichText('colors', fg='red'))
+    p.success('This is a success message that is way too long to fit on a single line of the console')
+    p.failure('Failure with wide characters: 漢字漢字')
+    p.alinea_decr()
+    p.print('This is a long message which is wrapped on several lines, ' * 3, label='info', status='ok',
+            wrap=True)
+    p.flush()
+
+
+corpus['printer_messages'] = lambda: capture(printer_messages)
+
+# Fast paths, each of them compared with the straightforward way of computing the same result
+fastpaths = {}
+
+
+def fastpath_pieces():
+    rng = random.Random(15)
+    return [RichText(''.join(rng.choice('ab \t\n') for _ in range(rng.randint(0, 6))),
+                     fg=rng.choice(['red', 'blue', None]), style=rng.choice([None, 'bold']))
+            for _ in range(500)]
+
+
+def fastpath_join():
+    pieces = fastpath_pieces()
+    joined = RichText('')
+    for i in range(len(pieces)):
+        joined = joined + (RichText(', ', fg='green') if i > 0 else '') + pieces[i]
+    return str(RichText(', ', fg='green').join(pieces)) == str(joined)
+
+
+def fastpath_split():
+    text = RichText('').join(fastpath_pieces())
+    return all([str(x) for x in text.split(sep)] == [str(x) for x in text.isplit(sep)] and
+               [x.str() for x in text.split(sep)] == text.str().split(sep) for sep in [' ', '\n', 'ab', None])
+
+
+def fastpath_slicing():
+    text = RichText('').join(fastpath_pieces())
+    cropped = copy.deepcopy(text).__lcrop__(100).__rcrop__(len(text) - 1500)
+    return str(text[100:1500]) == str(cropped) and text[:0] == RichText('') and text[-1].str() == text.str()[-1]
+
+
+def fastpath_expandtabs():
+    text = RichText('').join(fastpath_pieces())
+    return all(copy.deepcopy(text).expandtabs(n).str() == text.str().expandtabs(n) for n in [0, 1, 4, 8])
+
+
+def fastpath_stylize_ranges():
+    # Sorted non-overlapping ranges use a direct overlay, shuffled ones go through the sweep line
+    text = RichText('').join(fastpath_pieces())
+    ranges = [(i, i + 3, {'bg': 'yellow'}) for i in range(0, len(text) - 3, 7)]
+    shuffled = list(ranges)
+    random.Random(16).shuffle(shuffled)
+    return str(copy.deepcopy(text).stylize_ranges(ranges)) == str(copy.deepcopy(text).stylize_ranges(shuffled))
+
+
+def fastpath_highlight_many():
+    # Matches of different patterns never overlap here, so that both ways give the same result
+    text = RichText('').join(fastpath_pieces())
+    sequential = copy.deepcopy(text).highlight('a+', fg='red').highlight('b+', bg='blue')
+    return str(copy.deepcopy(text).highlight_many([('a+', {'fg': 'red'}), ('b+', {'bg': 'blue'})])) == \
+        str(sequential)
+
+
+def fastpath_render():
+    box = ChartBox()
+    box.append(fastpath_pieces()[:100])
+    rendered = '\n'.join(str(s) for s in box)
+    return RichText.from_ansi(''.join(box.iter_render(chunk_size=1))) == RichText.from_ansi(rendered) and \
+        ''.join(box.iter_render()) == rendered and str(box) == rendered
+
+
+def fastpath_serialization():
+    items = fastpath_pieces() + ['plain', '']
+    decoded = decode_texts(encode_texts(items))
+    return [str(x) for x in decoded] == [str(x) for x in items] and \
+        all(RichText.from_ansi(str(x)) == x for x in items if isinstance(x, RichText) and len(x) > 0)
+
+
+def fastpath_width():
+    texts = ['abc', 'café', '漢字 and text', 'é', '']
+    return all(RichText(t, fg='red').width() == display_width(t) == display_width(RichText(t)) for t in texts)
+
+
+def fastpath_scrolling_bars():
+    values = integers(17, 200, 0, 100)
+    scrolling = ScrollingBars(capacity=40, height=10, color=colorfun).extend(values)
+    return capture(scrolling.plot) == capture(lambda: Bars(height=10, spacing=1, thickness=1, color=colorfun).plot(
+        values[-40:]))
+
+
+def fastpath_layout_cache():
+    bars = Bars(height=8, spacing=2, thickness=8)
+    fun = lambda: bars.plot(list(range(1, 11)), labels=['Label number ' + str(i) for i in range(10)], title='Title')
+    return capture(fun) == capture(fun)
+
+
+for name, fun in list(globals().items()):
+    if name.startswith('fastpath_') and name != 'fastpath_pieces':
+        fastpaths[name[len('fastpath_'):]] = fun
+
+# Run the corpus
+tests = {}
+if not os.path.isdir(golden_dir):
+    os.makedirs(golden_dir)
+timings = {}
+if os.path.isfile(timings_file):
+    with open(timings_file) as f:
+        timings = json.load(f)
+new_timings = {}
+print('****************************************************************')
+print('*** GOLDEN OUTPUT AND TIMING TESTS *****************************')
+print('****************************************************************')
+measure = timing or update
+calibration = best_duration(calibration_loop, 5)[1] if measure else None
+for name, fun in corpus.items():
+    output, duration = best_duration(fun, 3 if measure else 1)
+    if measure:
+        new_timings[name] = duration / calibration
+    golden_file = os.path.join(golden_dir, name + '.txt')
+    if update:
+        with open(golden_file, 'w', encoding='utf-8', newline='') as f:
+            f.write(output)
+    if not os.path.isfile(golden_file):
+        print(name.ljust(30) + 'missing golden file, run with --update')
+        tests['golden_' + name] = [False]
+        continue
+    with open(golden_file, encoding='utf-8', newline='') as f:
+        is_identical = f.read() == output
+    if not measure:
+        print(name.ljust(30) + ('identical' if is_identical else 'OUTPUT CHANGED'))
+        tests['golden_' + name] = [is_identical]
+        continue
+    # Reference durations are stored in units of the calibration loop duration
+    reference = timings.get(name) * calibration if name in timings and not update else None
+    is_fast = reference is None or duration <= max(reference, min_duration) * tolerance
+    print(name.ljust(30) + ('{:.4f}s'.format(duration)).rjust(10) +
+          ('' if reference is None else ' (reference {:.4f}s)'.format(reference)) +
+          ('' if is_identical else ' OUTPUT CHANGED') + ('' if is_fast else ' TOO SLOW'))
+    tests['golden_' + name] = [is_identical, is_fast]
+if update:
+    with open(timings_file, 'w') as f:
+        json.dump(new_timings, f, indent=4, sort_keys=True)
+for name, fun in fastpaths.items():
+    tests['fastpath_' + name] = [fun()]
+
+
+print('****************************************************************')
+print('*** SUMMARY ****************************************************')
+print('****************************************************************')
+for k in tests.keys():
+    output_msg = ('TEST \'' + k + '\'').ljust(40) + ': '
+    success = sum(1 for x in tests.get(k) if x) == len(tests.get(k))
+    if success:
+        output_msg += 'OK'.center(6)
+    else:
+        output_msg += 'FAILED'
+    print(output_msg)
@@ -65,3 +65,115 @@ sb.plot(data, legendpos='right', title='Percentage stacked bars with legend on t
 sb.plot(data, legendpos='bottom', title='Percentage stacked bars with legend below the figure'.title())
 
 print(RichText(' ', bg='blue') + ' ' + RichText(' ', fg='blue', style='bold+underline'))
+
+# Chart boxes can be pickled in a compact format
+import pickle
+import sys
+box = ChartBox()
+box.append([RichText('  ', bg='red') + ' red', RichText('  ', bg='green') + ' green', 'plain'])
+print(pickle.loads(pickle.dumps(box)))
+box.write_to(sys.stdout, chunk_size=16)
+print()
+
+# Figures can be drawn cell by cell in a frame buffer, styles are only grouped into runs when output
+grid = CellGrid(12, 3)
+grid.fill(0, 0, 12, '-', grid.styleid(style='bold'))
+grid.fill(2, 1, 3, ' ', grid.styleid(bg='red'))
+grid.fill(7, 1, 3, ' ', grid.styleid(bg='green'))
+grid.write(2, 2, 'abc', grid.styleid(fg='red', style='bold'))
+grid.write(10, 2, 'clipped', grid.styleid(fg='green'))
+print(grid.chartbox().reverse())
+
+# Sub-cell resolution: bar tops drawn with eighth blocks
+bars = Bars(height=8, showvalues=True, spacing=1, thickness=3, subcells=True)
+bars.plot([0, 1, 3, 5, 7, 8, 11, 13, 16, 20, 24, 31, 32], labels=list(string.ascii_uppercase[:13]))
+pnb = PositiveNegativeBars(height=10, ymax=5, ymin=-5, subcells=True)
+pnb.plot([x / 2 for x in range(-10, 11)], ticks='all')
+
+# Braille line and scatter charts (require numpy)
+try:
+    import numpy
+except ImportError:
+    numpy = None
+if numpy is not None:
+    t = numpy.linspace(0, 4 * numpy.pi, 200)
+    Line(width=60, height=12).plot([numpy.sin(t), numpy.cos(t)], x=t, legend=['sin', 'cos'], title='Waves')
+    Scatter(width=40, height=10).plot(numpy.random.default_rng(0).normal(size=500), legend=['noise'],
+                                      legendpos='bottom')
+    Line(width=80, height=15).plot(numpy.cumsum(numpy.random.default_rng(1).normal(size=1000000)),
+                                   title='Random walk with a million points')
+
+# Heatmaps of 2-D arrays (require numpy)
+if numpy is not None:
+    x, y = numpy.meshgrid(numpy.linspace(-3, 3, 300), numpy.linspace(-2, 2, 120))
+    z = numpy.sin(2 * x) * numpy.cos(3 * y) + 0.2 * x
+    z[:20, :60] = numpy.nan
+    Heatmap(width=60, height=15, palette='16').plot(z, title='Heatmap with 16 colors')
+    Heatmap(width=60, height=12).plot(z, legendpos='bottom', title='Heatmap with 256 colors')
+    Heatmap(palette='truecolor').plot(numpy.arange(12).reshape(3, 4), legendpos='top', ticks='all')
+
+# Charts are not modified when plotting, plotting twice gives the same figure
+import contextlib
+import copy
+import io
+pnb = PositiveNegativeBars(height=7, ymax=5, ymin=-1)
+sb = StackedBars(height=10, spacing=1, thickness=3)
+# Deep comparison of the chart attributes, the layout cache being the only state written to while plotting
+chart_state = lambda chart: {k: copy.deepcopy(v) for k, v in chart.__dict__.items() if k != '_layout_cache'}
+state = [chart_state(pnb), chart_state(sb)]
+outputs = []
+for _ in range(2):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        pnb.plot([-1, 2, 5, 3])
+        sb.plot([{'A': 5, 'B': 12}, {'A': 7, 'C': 15}], ticks='all')
+    outputs.append(out.getvalue())
+print('Charts unchanged by plotting:', state == [chart_state(pnb), chart_state(sb)])
+print('Identical renderings:', outputs[0] == outputs[1])
+
+# Percentage stacked bars do not modify input data
+data = [{'A': 5, 'B': 12}, {'A': 7, 'C': 15}, {'B': 36}]
+data_copy = copy.deepcopy(data)
+with contextlib.redirect_stdout(io.StringIO()):
+    PercentageStackedBars(height=10).plot(data)
+print('Input data unchanged by percentage stacked bars:', data == data_copy)
+
+# The chart chrome (footer, legend, title) is cached between plots with the same layout
+bars = Bars(height=8, spacing=2, thickness=8)
+labels = ['Label number ' + str(i) for i in range(10)]
+outputs = []
+for _ in range(2):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        bars.plot(list(range(1, 11)), labels=labels, title='Cached chrome')
+    outputs.append(out.getvalue())
+print('Cached chrome gives the same figure:', outputs[0] == outputs[1], len(bars._layout_cache) == 3)
+
+# Scrolling bar chart fed value by value
+colorfun = lambda index, y: 'red' if y > 50 else 'green'
+scrolling = ScrollingBars(capacity=30, height=8, color=colorfun)
+values = [random.randint(0, 60) for _ in range(100)]
+scrolling.extend(values)
+scrolling.plot(title='Last 30 values')
+out = [io.StringIO(), io.StringIO()]
+with contextlib.redirect_stdout(out[0]):
+    scrolling.plot()
+with contextlib.redirect_stdout(out[1]):
+    Bars(height=8, spacing=1, thickness=1, color=colorfun).plot(values[-30:])
+print('Scrolling bars match regular bars:', out[0].getvalue() == out[1].getvalue())
+zeros = [io.StringIO(), io.StringIO()]
+with contextlib.redirect_stdout(zeros[0]):
+    ScrollingBars(capacity=10, height=5).extend([0] * 10).plot()
+with contextlib.redirect_stdout(zeros[1]):
+    Bars(height=5, spacing=1, thickness=1).plot([0] * 10)
+print('Scrolling bars match regular bars with zero values:', zeros[0].getvalue() == zeros[1].getvalue())
+
+# Decimal values rounding to integers are displayed without a trailing dot
+print('Nice numbers:', [str(NiceNumber(v)) for v in [0.9999, -0.9996, 0.5]] == ['1', '-1', '0.5'])
+
+# Partially filled top cells take the color of the bar at its value
+import re
+out = io.StringIO()
+with contextlib.redirect_stdout(out):
+    StackedBars(height=10, subcells=True).plot([{'A': 5, 'B': 12}, {'A': 7, 'C': 15}, {'B': 36}, {'C': 4, 'D': 87}])
+print('Colored partial cells:', re.search('(^|\x1b\\[0m|[ |])[\u2581-\u2587]', out.getvalue(), re.M) is None)
@@ -1,5 +1,6 @@
 import copy
 import sys
+import re as regex  # re is a test string below
 sys.path.append('./')
 from consoleprint import RichText
 
@@ -107,7 +108,17 @@ tests['substring'] = [
     printreturn(cstr[7:12]).str() == 'green',
     printreturn(cstr[:]).str() == 'redbluegreen',
     printreturn(cstr[1: 5]).str() == 'edbl',
-    printreturn(cstr[-7:-2]).str() == 'uegre']
+    printreturn(cstr[-7:-2]).str() == 'uegre',
+    printreturn(cstr[-1]) == gn,
+    printreturn(cstr[-12]) == rr,
+    printreturn(cstr[2:5]) == rd + bb + bl,
+    printreturn(cstr[-9:]) == blue + green,
+    cstr[:0] == empty,
+    cstr[0:0] == empty,
+    cstr[5:2] == empty,
+    cstr[:-100] == empty,
+    cstr[100:] == empty,
+    [x.str() for x in cstr] == list(cstr.str())]
 print('****************************************************************')
 print('*** STRING TRANSFORMATION TESTS ********************************')
 print('****************************************************************')
@@ -166,9 +177,252 @@ print('****************************************************************')
 print('*** EXPANDTABS TESTS *******************************************')
 print('****************************************************************')
 teststr = RichText('\tred', fg='red') + '\t' + RichText('bl\tue', fg='blue') + '\t' + RichText('green\t', fg='green')
-answer = RichText('   red', fg='red') + '   ' + RichText('bl   ue', fg='blue') + '   ' + RichText('green   ', fg='green')
-tests['expandtabs'] = [printreturn(teststr.expandtabs(3)) == answer]
+answer = RichText('   red', fg='red') + '   ' + RichText('bl ue', fg='blue') + ' ' + RichText('green ', fg='green')
+multiline = RichText('a\tb', fg='red') + '\n\tcd\t' + RichText('\r\txyz\t\t', fg='blue') + 'end'
+tests['expandtabs'] = [printreturn(teststr.expandtabs(3)) == answer,
+    all(copy.deepcopy(multiline).expandtabs(n).str() == multiline.str().expandtabs(n) for n in range(-1, 10)),
+    printreturn(copy.deepcopy(multiline).expandtabs(4)) ==
+    RichText('a   b', fg='red') + '\n    cd  ' + RichText('\r    xyz     ', fg='blue') + 'end',
+    RichText('\t' * 100000).expandtabs(2).str() == ' ' * 200000]
 
+print('****************************************************************')
+print('*** ANSI PARSING TESTS *****************************************')
+print('****************************************************************')
+from consoleprint import AnsiParser
+teststr = red + ' ' + RichText('bold blue', fg='blue', style='bold') + ' ' + RichText('on green', fg=214, bg='green') + \
+    RichText(' truecolor', fg=(10, 20, 30), style='underline+crossed') + ' plain'
+ansi = str(teststr)
+chunks = [ansi.encode()[i:i+3] for i in range(0, len(ansi.encode()), 3)]
+parser = AnsiParser()
+streamed = RichText('')
+for chunk in chunks:
+    streamed += parser.feed(chunk)
+tests['from_ansi'] = [
+    printreturn(RichText.from_ansi(ansi)) == teststr,
+    printreturn(RichText.from_ansi(ansi.encode())) == teststr,
+    printreturn(streamed) == teststr,
+    printreturn(RichText.from_ansi('\x1b[1;91mbright\x1b[22;39m \x1b[Kdefault\x1b[0m')) ==
+    RichText('bright', fg=9, style='bold') + ' default',
+    printreturn(RichText.from_ansi('caf\u00e9 \u6f22\u5b57'.encode())).str() == 'caf\u00e9 \u6f22\u5b57',
+    printreturn(RichText.from_ansi('\x1b[31mred\x1b(B\x1b[m plain')) == RichText('red', fg='red') + ' plain',
+    printreturn(RichText.from_ansi('\x1b]0;title\x07a \x1b]8;;http://example.com\x1b\\link\x1b]8;;\x1b\\')).str() == 'a link']
+# OSC and ESC sequences split across chunks
+ansi = '\x1b]0;title\x07\x1b[31mred\x1b(B\x1b[m plain \x1b]8;;http://example.com\x1b\\link'
+for size in range(1, 6):
+    parser = AnsiParser()
+    streamed = RichText('')
+    for i in range(0, len(ansi), size):
+        streamed += parser.feed(ansi[i:i+size])
+    streamed += parser.feed('', final=True)
+    tests['from_ansi'].append(printreturn(streamed) == RichText('red', fg='red') + ' plain link')
+
+print('****************************************************************')
+print('*** DISPLAY WIDTH TESTS ****************************************')
+print('****************************************************************')
+from consoleprint import display_width
+cjk = RichText('\u6f22\u5b57', fg='red')  # 2 wide characters
+emoji = RichText('\U0001F600', fg='blue')  # 1 wide character
+combining = RichText('e\u0301', fg='green')  # 'e' with a combining accent
+tests['display_width'] = [
+    len(cjk) == 2 and cjk.width() == 4,
+    len(emoji) == 1 and emoji.width() == 2,
+    len(combining) == 2 and combining.width() == 1,
+    display_width('abc') == 3 and display_width('caf\u00e9') == 4 and display_width(cjk + 'ab') == 6,
+    printreturn(copy.deepcopy(cjk).ljust(8, fillchar='*')).str() == '\u6f22\u5b57****',
+    printreturn(copy.deepcopy(cjk).rjust(8, fillchar='*')).str() == '****\u6f22\u5b57',
+    printreturn(copy.deepcopy(cjk).center(8, fillchar='*')).str() == '**\u6f22\u5b57**',
+    copy.deepcopy(emoji + combining).center(10).width() == 10]
+
+print('****************************************************************')
+print('*** WRAPPING TESTS *********************************************')
+print('****************************************************************')
+teststr = red + ' ' + green + ' ' + blue + ' ' + RichText('redgreenblue', fg='red') + '\n' + blue
+tests['wrap'] = [
+    printreturn(teststr.wrap(10)) == [red + ' ' + green, blue, RichText('redgreenbl', fg='red'),
+                                      RichText('ue', fg='red'), blue],
+    printreturn(teststr.wrap(12, subsequent_indent='  ')) == [red + ' ' + green, '  ' + blue,
+                                                             '  ' + RichText('redgreenbl', fg='red'),
+                                                             '  ' + RichText('ue', fg='red'), '  ' + blue],
+    printreturn(teststr.wrap(40, indent='* ')) == ['* ' + red + ' ' + green + ' ' + blue + ' ' +
+                                                   RichText('redgreenblue', fg='red'), blue],
+    printreturn(teststr.fill(10)) == RichText('\n').join(teststr.wrap(10)),
+    printreturn(RichText('').wrap(10)) == [],
+    max(line.width() for line in RichText('\u6f22\u5b57 ' * 10, fg='red').wrap(9)) <= 9]
+
+print('****************************************************************')
+print('*** HIGHLIGHTING TESTS *****************************************')
+print('****************************************************************')
+teststr = red + ' ' + green + ' ' + blue
+logline = RichText('GET 10.0.0.1 status=500 took 35ms', style='italic')
+tests['highlight'] = [
+    printreturn(copy.deepcopy(teststr).highlight('e+', style='bold')) ==
+    rr + RichText('e', fg='red', style='bold') + rd + ' ' + gg + gr + RichText('ee', fg='green', style='bold') + gn +
+    ' ' + bb + bl + bu + RichText('e', fg='blue', style='bold'),
+    printreturn(copy.deepcopy(teststr).highlight('d g', bg='white')) ==
+    rr + re + RichText('d', fg='red', bg='white') + RichText(' ', bg='white') + RichText('g', fg='green', bg='white') +
+    gr + ge + ge + gn + ' ' + blue,
+    printreturn(copy.deepcopy(teststr).highlight('x*')) == teststr,
+    printreturn(copy.deepcopy(logline).highlight_many([
+        (r'\d+\.\d+\.\d+\.\d+', {'fg': 'cyan'}),
+        (r'status=5\d\d', {'fg': 'red', 'style': 'bold'}),
+        (r'\d+ms', {'fg': 'yellow'})])) ==
+    RichText('GET ', style='italic') + RichText('10.0.0.1', fg='cyan', style='italic') + RichText(' ', style='italic') +
+    RichText('status=500', fg='red', style='bold') + RichText(' took ', style='italic') +
+    RichText('35ms', fg='yellow', style='italic'),
+    printreturn(RichText('ERROR here').highlight(regex.compile('error', regex.I), fg='red')) ==
+    RichText('ERROR', fg='red') + ' here',
+    printreturn(RichText('a11b').highlight(r'(\d)\1', fg='red')) == 'a' + RichText('11', fg='red') + 'b',
+    printreturn(RichText('ERROR here').highlight_many([(regex.compile('error', regex.I), {'fg': 'red'}),
+                                                        ('h e', {'bg': 'blue'})], flags=regex.X)) ==
+    RichText('ERROR', fg='red') + ' ' + RichText('he', bg='blue') + 're']
+try:
+    RichText('a11b').highlight_many([(r'(\d)\1', {'fg': 'red'})])
+    tests['highlight'].append(False)
+except ValueError:
+    tests['highlight'].append(True)
+
+print('****************************************************************')
+print('*** RANGE STYLING TESTS ****************************************')
+print('****************************************************************')
+teststr = red + ' ' + green + ' ' + blue
+plain = RichText('0123456789')
+tests['stylize_ranges'] = [
+    printreturn(copy.deepcopy(plain).stylize_ranges([(2, 6, {'fg': 'red'}), (4, 8, {'fg': 'blue', 'style': 'bold'})])) ==
+    RichText('01') + RichText('23', fg='red') + RichText('4567', fg='blue', style='bold') + RichText('89'),
+    printreturn(copy.deepcopy(plain).stylize_ranges([(4, 8, {'fg': 'blue'}), (2, 6, {'fg': 'red', 'bg': 'white'})])) ==
+    RichText('01') + RichText('2345', fg='red', bg='white') + RichText('67', fg='blue') + RichText('89'),
+    printreturn(copy.deepcopy(plain).stylize_ranges([(0, 10, {'bg': 'white'}), (3, 5, {'fg': 'red'}),
+                                                     (4, 7, {'bg': 'black'})])) ==
+    RichText('012', bg='white') + RichText('3', fg='red', bg='white') + RichText('4', fg='red', bg='black') +
+    RichText('56', bg='black') + RichText('789', bg='white'),
+    printreturn(copy.deepcopy(teststr).stylize_ranges([(2, 6, {'fg': 'blue', 'bg': 'white'}),
+                                                       (0, 1, {'style': 'bold'})], layer='under')) ==
+    RichText('r', fg='red', style='bold') + RichText('e', fg='red') + RichText('d', fg='red', bg='white') +
+    RichText(' ', fg='blue', bg='white') + RichText('gr', fg='green', bg='white') + ge + ge + gn + ' ' + blue,
+    printreturn(copy.deepcopy(teststr).stylize_ranges([(-5, 99, {'fg': 'cyan'})])) == RichText(teststr.str(), fg='cyan'),
+    len(copy.deepcopy(plain).stylize_ranges([(i, i + 3, {'fg': i % 8}) for i in range(10)]).__sbox__) == 10,
+    printreturn(copy.deepcopy(plain).stylize_ranges([(4, 8, {'fg': [0, 0, 255]}), (2, 6, {'bg': [255, 0, 0]})])) ==
+    RichText('01') + RichText('23', bg=[255, 0, 0]) + RichText('45', fg=[0, 0, 255], bg=[255, 0, 0]) +
+    RichText('67', fg=[0, 0, 255]) + RichText('89')]
+
+print('****************************************************************')
+print('*** SERIALIZATION TESTS ****************************************')
+print('****************************************************************')
+import pickle
+import time
+teststr = red + ' ' + RichText('\u6f22\u5b57', fg=(10, 20, 30), bg=214, style='bold+underline') + ' ' + green + \
+    '\U0001F600' + blue
+tests['serialization'] = [
+    printreturn(RichText.from_bytes(teststr.to_bytes())) == teststr,
+    printreturn(pickle.loads(pickle.dumps(teststr))) == teststr,
+    printreturn(pickle.loads(pickle.dumps([teststr, empty, 'plain string']))) == [teststr, empty, 'plain string'],
+    RichText.from_bytes(teststr.to_bytes()).__sbox__[2].fg() == (10, 20, 30),
+    printreturn(copy.deepcopy(teststr)) == teststr and copy.deepcopy(teststr).__sbox__[0] is not teststr.__sbox__[0]]
+# Size and speed comparison against pickling the default object state
+bigstr = RichText('')
+for i in range(2000):
+    bigstr += RichText('word' + str(i) + ' ', fg=['red', 'green', 'blue'][i % 3], style='bold' if i % 2 else None)
+start = time.time()
+for i in range(20):
+    default_pickle = pickle.dumps((bigstr.__text__, bigstr.__sbox__))
+    pickle.loads(default_pickle)
+default_time = time.time() - start
+start = time.time()
+for i in range(20):
+    compact_pickle = pickle.dumps(bigstr)
+    pickle.loads(compact_pickle)
+compact_time = time.time() - start
+print('default pickle: ' + str(len(default_pickle)) + ' bytes, ' + str(round(default_time * 50, 2)) + ' ms per round trip')
+print('compact pickle: ' + str(len(compact_pickle)) + ' bytes, ' + str(round(compact_time * 50, 2)) + ' ms per round trip')
+tests['serialization'].append(len(compact_pickle) < len(default_pickle))
+
+print('****************************************************************')
+print('*** STREAMING RENDER TESTS *************************************')
+print('****************************************************************')
+import io
+teststr = red + ' ' + green + ' ' + blue + '\u6f22\u5b57'
+textfile = io.StringIO()
+binaryfile = io.BytesIO()
+longstr = RichText('x' * 1000000, fg='red')
+tests['iter_render'] = [
+    ''.join(teststr.iter_render()) == str(teststr),
+    RichText.from_ansi(''.join(teststr.iter_render(chunk_size=1))) == teststr,
+    len(list(teststr.iter_render(chunk_size=1))) == 16,
+    ''.join(teststr.iter_render(chunk_size=5)) == str(teststr),
+    b''.join(teststr.iter_render(encoding='utf-8')) == str(teststr).encode('utf-8'),
+    textfile.getvalue() == str(teststr) if teststr.write_to(textfile) else False,
+    binaryfile.getvalue() == str(teststr).encode('utf-8') if teststr.write_to(binaryfile, encoding='utf-8') else False,
+    list(empty.iter_render()) == [],
+    RichText.from_ansi(''.join(longstr.iter_render(chunk_size=1024))) == longstr,
+    printreturn(max(len(chunk) for chunk in longstr.iter_render(chunk_size=1024))) <= 2 * 1024 + 16]
+
+print('****************************************************************')
+print('*** JOIN AND LAZY SPLITTING TESTS ******************************')
+print('****************************************************************')
+teststr = red + '\n' + green + '\n\n' + blue
+lines = teststr.isplit('\n')
+tests['join_isplit'] = [
+    printreturn(next(lines)) == red,
+    printreturn(next(lines)) == green,
+    printreturn(list(lines)) == [empty, blue],
+    printreturn(RichText(', ', fg='blue').join([red, 'plain', green])) ==
+    red + RichText(', ', fg='blue') + 'plain' + RichText(', ', fg='blue') + green,
+    printreturn(RichText('*').join(x for x in [red, green, blue])) == red + '*' + green + '*' + blue,
+    RichText('*').join([]) == empty,
+    printreturn(teststr.split('\n', 1)) == [red, green + '\n\n' + blue],
+    printreturn((' ' + red + '  ' + green + ' \t' + blue + ' ').split(None)) == [red, green, blue],
+    printreturn((' ' + red + '  ' + green + ' \t' + blue + ' ').split(None, 1)) == [red, green + ' \t' + blue + ' '],
+    len(RichText('a\n' * 100000, fg='red').split('\n')) == 100001]
+
+print('****************************************************************')
+print('*** EQUALITY AND HASHING TESTS *********************************')
+print('****************************************************************')
+split_red = rr + re + rd
+boxes_before = len(split_red.__sbox__)
+frozen = (red + blue).freeze()
+try:
+    frozen += green
+    frozen_concat = True
+except TypeError:
+    frozen_concat = False
+try:
+    frozen.freeze().upper()
+    frozen_upper = True
+except TypeError:
+    frozen_upper = False
+# Methods editing style boxes in place must fail before any change
+frozen_intact = []
+for method, args in [('center', (20,)), ('rjust', (20,)), ('replace', ('r', 'xyz')), ('__lcrop__', (1,)),
+                     ('__rcrop__', (1,)), ('stylize_ranges', ([(0, 2, {'fg': 'green'})],)), ('expandtabs', ())]:
+    frozen_copy = (red + ' ' + blue).freeze()
+    try:
+        getattr(frozen_copy, method)(*args)
+        frozen_intact.append(False)
+    except TypeError:
+        frozen_intact.append(str(frozen_copy) == str(red + ' ' + blue) and frozen_copy == red + ' ' + blue)
+try:
+    hash(red)
+    hashable_unfrozen = True
+except TypeError:
+    hashable_unfrozen = False
+tests['equality_hashing'] = [
+    split_red == red,
+    len(split_red.__sbox__) == boxes_before,
+    red != blue,
+    RichText('red', fg='blue') != red,
+    red != 'red',
+    frozen_concat and frozen == red + blue + green,
+    not frozen_upper,
+    printreturn(frozen_intact) == [True] * 7,
+    not hashable_unfrozen,
+    hash(copy.deepcopy(split_red).freeze()) == hash(copy.deepcopy(red).freeze()),
+    len({copy.deepcopy(split_red).freeze(), copy.deepcopy(red).freeze(), copy.deepcopy(blue).freeze()}) == 2,
+    not red.freeze().copy().is_frozen(),
+    copy.deepcopy(red) is red,
+    copy.deepcopy({red: 1}) == {red: 1},
+    pickle.loads(pickle.dumps({red: 1})) == {red: 1},
+    pickle.loads(pickle.dumps(red)).is_frozen() and not pickle.loads(pickle.dumps(blue)).is_frozen()]
+red = red.copy()
 
 
 print('****************************************************************')